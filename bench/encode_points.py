@@ -0,0 +1,104 @@
+"""
+Compare the cost of building influxdb_client Points against the cached
+line-protocol encoder, and check that both produce identical output.
+
+Usage:
+    python bench/encode_points.py [--lines N] [--inverters N] [--ticks N]
+"""
+import os
+import sys
+import argparse
+import timeit
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from influxdb_client import Point, WritePrecision
+
+from envoy_logger.cfg import Config
+from envoy_logger.model import SampleData, InverterSample
+from envoy_logger.line_protocol import LineEncoder
+
+from payloads import make_production_json, make_inverters_json
+
+def point_from_line(envoy_cfg, measurement_type, idx, data):
+    p = Point(f"{measurement_type}-line{idx}")
+    p.time(data.ts, WritePrecision.MS)
+    p.tag("source", envoy_cfg.source_tag)
+    p.tag("measurement-type", measurement_type)
+    p.tag("line-idx", idx)
+    p.field("P", data.wNow)
+    p.field("Q", data.reactPwr)
+    p.field("S", data.apprntPwr)
+    p.field("I_rms", data.rmsCurrent)
+    p.field("V_rms", data.rmsVoltage)
+    return p
+
+def point_from_inverter(envoy_cfg, inverter):
+    p = Point(f"inverter-production-{inverter.serial}")
+    p.time(inverter.ts, WritePrecision.MS)
+    p.tag("source", envoy_cfg.source_tag)
+    p.tag("measurement-type", "inverter")
+    p.tag("serial", inverter.serial)
+    envoy_cfg.apply_tags_to_inverter_point(p, inverter.serial)
+    p.field("P", inverter.watts)
+    return p
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=3)
+    parser.add_argument("--inverters", type=int, default=60)
+    parser.add_argument("--ticks", type=int, default=500)
+    args = parser.parse_args()
+
+    inverters_cfg = {}
+    for i in range(args.inverters):
+        inverters_cfg[str(202200000000 + i)] = {"tags": {"row": i // 10, "col": i % 10, "array name": "south,roof"}}
+    cfg = Config({
+        "enphaseenergy": {"email": "", "password": ""},
+        "envoy": {"serial": "0", "tag": "power-meter"},
+        "influxdb": {"url": "", "token": "", "bucket": "b"},
+        "inverters": inverters_cfg,
+    })
+    envoy_cfg = cfg.envoys[0]
+
+    ts = datetime.now(timezone.utc)
+    data = SampleData(make_production_json(args.lines, args.inverters), ts)
+    inverters = [InverterSample(d, ts) for d in make_inverters_json(args.inverters)]
+    eims = [
+        ("consumption", data.total_consumption),
+        ("production", data.total_production),
+        ("net", data.net_consumption),
+    ]
+
+    def via_point():
+        out = []
+        for measurement_type, eim in eims:
+            for i, line in enumerate(eim.lines):
+                out.append(point_from_line(envoy_cfg, measurement_type, i, line).to_line_protocol())
+        for inverter in inverters:
+            out.append(point_from_inverter(envoy_cfg, inverter).to_line_protocol())
+        return out
+
+    encoder = LineEncoder(envoy_cfg)
+    def via_encoder():
+        out = []
+        for measurement_type, eim in eims:
+            for i, line in enumerate(eim.lines):
+                out.append(encoder.encode_line_sample(measurement_type, i, line))
+        for inverter in inverters:
+            out.append(encoder.encode_inverter_sample(inverter))
+        return out
+
+    a = via_point()
+    b = via_encoder()
+    assert a == b, "Encoder output differs from Point output"
+    print(f"Output identical: {len(a)} lines per tick")
+
+    t_point = timeit.timeit(via_point, number=args.ticks) / args.ticks
+    t_encoder = timeit.timeit(via_encoder, number=args.ticks) / args.ticks
+    print(f"Point:   {t_point * 1e6:8.1f} us/tick")
+    print(f"Encoder: {t_encoder * 1e6:8.1f} us/tick ({t_point / t_encoder:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Local stand-ins for an Envoy and for InfluxDB, so that the logging pipeline
+can be exercised and benchmarked without real hardware.
+
+FakeEnvoy serves:
+    /auth/check_jwt
+    /production.json
+    /api/v1/production/inverters
+    /inventory.json
+Responses are either synthetic, or replayed from recorded JSON files.
+Any path prefix is ignored, so many simulated gateways can share one server
+by using different base URLs. eg: http://127.0.0.1:8080/gw0, http://127.0.0.1:8080/gw1
+
+FakeInfluxDB accepts /api/v2/write and captures the line protocol it receives.
+
+Can also be run standalone:
+    python bench/fake_envoy.py --port 8080 --influxdb-port 8086 --inverters 60 --latency 0.05
+"""
+import os
+import sys
+import json
+import gzip
+import time
+import random
+import threading
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from payloads import make_production_json, make_inverters_json
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Allow keep-alive
+    protocol_version = "HTTP/1.1"
+    # Headers and body are sent separately. Don't let Nagle stall the body
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body: bytes, content_type: str = "application/json", headers: dict = None) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_empty(self, code: int) -> None:
+        self.send_response(code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class FakeEnvoy:
+    def __init__(
+        self,
+        port: int = 0,
+        n_lines: int = 2,
+        n_inverters: int = 16,
+        latency: float = 0.0,
+        production_json: Optional[str] = None,
+        inverters_json: Optional[str] = None,
+        report_interval: float = 300,
+    ) -> None:
+        """
+        port: Port to listen on. 0 picks a free one
+        n_lines: Lines per measurement type
+        n_inverters: Number of simulated microinverters
+        latency: Added delay per request, in seconds
+        production_json/inverters_json: Serve these recorded responses instead
+        report_interval: How often simulated inverters report in
+        """
+        self.latency = latency
+        self.n_lines = n_lines
+        self.n_inverters = n_inverters
+        self.report_interval = report_interval
+        self.request_count = 0
+
+        self._recorded_production = None
+        if production_json:
+            with open(production_json, "rb") as f:
+                self._recorded_production = f.read()
+        self._recorded_inverters = None
+        if inverters_json:
+            with open(inverters_json, "rb") as f:
+                self._recorded_inverters = f.read()
+
+        # Synthetic payloads are generated once and reused. Only the bits that
+        # matter to the logger are refreshed
+        self._production = make_production_json(n_lines, n_inverters)
+        self._inverters = make_inverters_json(n_inverters)
+
+        envoy = self
+        class Handler(_Handler):
+            def do_GET(self):
+                envoy.request_count += 1
+                if envoy.latency:
+                    time.sleep(envoy.latency)
+                path = self.path.split("?")[0]
+                if path.endswith("/auth/check_jwt"):
+                    self.send_body(
+                        b"<!DOCTYPE html><h2>Valid token.</h2>",
+                        "text/html",
+                        {"Set-Cookie": "sessionId=fake-session; Path=/"},
+                    )
+                elif path.endswith("/production.json"):
+                    self.send_body(envoy.production_body())
+                elif path.endswith("/api/v1/production/inverters"):
+                    self.send_body(envoy.inverters_body())
+                elif path.endswith("/inventory.json"):
+                    self.send_body(envoy.inventory_body())
+                else:
+                    self.send_empty(404)
+
+        self.server = _Server(("127.0.0.1", port), Handler)
+        self.port = self.server.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self) -> 'FakeEnvoy':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def production_body(self) -> bytes:
+        if self._recorded_production is not None:
+            return self._recorded_production
+        for eim in self._production["production"][1:] + self._production["consumption"]:
+            for line in eim["lines"]:
+                line["wNow"] = random.uniform(-5000, 5000)
+        return json.dumps(self._production).encode("utf-8")
+
+    def inverters_body(self) -> bytes:
+        if self._recorded_inverters is not None:
+            return self._recorded_inverters
+        now = int(time.time())
+        for i, inverter in enumerate(self._inverters):
+            # Each inverter reports in at its own phase of the report interval
+            phase = (i * 7) % self.report_interval
+            inverter["lastReportDate"] = int(now - ((now - phase) % self.report_interval))
+            inverter["lastReportWatts"] = random.randint(0, 300)
+        return json.dumps(self._inverters).encode("utf-8")
+
+    def inventory_body(self) -> bytes:
+        devices = [
+            {
+                "part_num": "800-01391-r02",
+                "installed": "1670000000",
+                "serial_num": inverter["serialNumber"],
+                "device_status": ["envoy.global.ok"],
+                "last_rpt_date": str(inverter["lastReportDate"]),
+                "admin_state": 1,
+                "dev_type": 1,
+                "created_date": "1670000000",
+                "img_load_date": "1670000000",
+                "img_pnum_running": "520-00082-r01-v04.27.04",
+                "ptpn": "540-00242-r01-v04.27.09",
+                "chaneid": 1627390225,
+                "device_control": [{"gficlearset": False}],
+                "producing": True,
+                "communicating": True,
+                "provisioned": True,
+                "operating": True,
+                "phase": "ph-a",
+            }
+            for inverter in self._inverters
+        ]
+        return json.dumps([
+            {"type": "PCU", "devices": devices},
+            {"type": "ACB", "devices": []},
+            {"type": "NSRB", "devices": []},
+        ]).encode("utf-8")
+
+
+class FakeInfluxDB:
+    """
+    Captures line protocol written to it
+    """
+    def __init__(self, port: int = 0, latency: float = 0.0, output_path: Optional[str] = None) -> None:
+        self.latency = latency
+        self.lines = [] # type: List[str]
+        self.line_count = 0
+        self.write_count = 0
+        self.keep_lines = True
+        self._lock = threading.Lock()
+        self._output = open(output_path, "a", encoding="utf-8") if output_path else None
+
+        influxdb = self
+        class Handler(_Handler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                if influxdb.latency:
+                    time.sleep(influxdb.latency)
+                if self.path.startswith("/api/v2/write"):
+                    influxdb.capture(body.decode("utf-8"))
+                    self.send_empty(204)
+                elif self.path.startswith("/api/v2/query"):
+                    self.send_body(b"", "text/csv")
+                else:
+                    self.send_empty(404)
+
+            def do_GET(self):
+                if self.path.startswith("/ping") or self.path.startswith("/health"):
+                    self.send_empty(204)
+                else:
+                    self.send_empty(404)
+
+        self.server = _Server(("127.0.0.1", port), Handler)
+        self.port = self.server.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self) -> 'FakeInfluxDB':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        if self._output:
+            self._output.close()
+
+    def capture(self, body: str) -> None:
+        lines = body.splitlines()
+        with self._lock:
+            self.write_count += 1
+            self.line_count += len(lines)
+            if self.keep_lines:
+                self.lines.extend(lines)
+            if self._output:
+                self._output.write(body + "\n")
+                self._output.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--influxdb-port", type=int, default=8086)
+    parser.add_argument("--lines", type=int, default=2)
+    parser.add_argument("--inverters", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--production-json", help="Serve this recorded production.json")
+    parser.add_argument("--inverters-json", help="Serve this recorded inverters response")
+    parser.add_argument("--capture", help="Append line protocol written to InfluxDB to this file")
+    args = parser.parse_args()
+
+    envoy = FakeEnvoy(
+        args.port, args.lines, args.inverters, args.latency,
+        args.production_json, args.inverters_json,
+    ).start()
+    influxdb = FakeInfluxDB(args.influxdb_port, output_path=args.capture).start()
+    influxdb.keep_lines = False
+    print(f"Fake envoy: {envoy.url}")
+    print(f"Fake InfluxDB: {influxdb.url}")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"envoy requests: {envoy.request_count}, InfluxDB lines: {influxdb.line_count}")
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Compare ways of finding the inverters with a new report on each tick.
+
+    dict:   parse_inverter_data() + filter_new_inverter_data(), as SamplingLoop
+            used to do
+    list:   InverterTable without numpy
+    numpy:  InverterTable with numpy (if installed)
+
+Inverters report every 5 minutes, so with a 5 s sampling interval about 1 in
+60 has a new report on any given tick.
+
+Usage:
+    python bench/inverter_filter.py [--inverters N ...] [--ticks N] [--interval S]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from envoy_logger import model
+
+from payloads import make_inverters_json
+
+def make_ticks(n_inverters, n_ticks, interval, report_interval=300):
+    """
+    Inverter payloads for consecutive ticks, with each inverter reporting
+    every report_interval
+    """
+    payload = make_inverters_json(n_inverters)
+    ticks = []
+    for tick in range(n_ticks):
+        payload = [dict(d) for d in payload]
+        for d in payload:
+            if random.random() < interval / report_interval:
+                d["lastReportDate"] += report_interval
+                d["lastReportWatts"] = random.randint(0, 300)
+        ticks.append(payload)
+    return ticks
+
+def run_dict(ticks, ts):
+    prev = {}
+    results = []
+    for payload in ticks:
+        data = model.parse_inverter_data(payload, ts)
+        results.append(model.filter_new_inverter_data(data, prev))
+        prev = data
+    return results
+
+def run_table(use_numpy):
+    def run(ticks, ts):
+        table = model.InverterTable(use_numpy=use_numpy)
+        return [table.update(payload, ts) for payload in ticks]
+    return run
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inverters", type=int, nargs="+", default=[16, 64, 256, 1024, 4096])
+    parser.add_argument("--ticks", type=int, default=500)
+    parser.add_argument("--interval", type=float, default=5)
+    args = parser.parse_args()
+
+    paths = [("dict", run_dict), ("list", run_table(False))]
+    if model.np is not None:
+        paths.append(("numpy", run_table(True)))
+    else:
+        print("numpy is not installed")
+
+    ts = datetime.now(timezone.utc)
+    print(f"{'inverters':>9s}" + "".join(f"{name:>14s}" for name, _ in paths) + "   (us/tick)")
+    for n in args.inverters:
+        ticks = make_ticks(n, args.ticks, args.interval)
+        expected = None
+        row = f"{n:9d}"
+        for name, run in paths:
+            t = time.perf_counter()
+            results = run(ticks, ts)
+            t = (time.perf_counter() - t) / args.ticks
+            serials = [sorted(r) for r in results]
+            expected = expected or serials
+            row += f"{t * 1e6:14.1f}" if serials == expected else f"{'MISMATCH':>14s}"
+        print(row)
+
+if __name__ == "__main__":
+    main()
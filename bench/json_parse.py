@@ -0,0 +1,79 @@
+"""
+Compare ways of parsing the production.json?details=1 payload into SampleData.
+
+    response.json(): What get_power_data used to do. Decode the text
+    json.loads:      Decode the bytes with the standard library (no orjson installed)
+    orjson:          Decode with orjson (if installed)
+
+Each path's result is checked against the response.json() path.
+
+Usage:
+    python bench/json_parse.py [--lines N] [--payload FILE] [--count N]
+
+--payload can be a recorded response, eg:
+    curl -k -H "Authorization: Bearer $TOKEN" https://envoy.local/production.json?details=1 > production.json
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from envoy_logger import model
+
+from payloads import make_production_json
+
+def response_json(body, ts):
+    # Equivalent of requests' response.json()
+    return model.SampleData(json.loads(body.decode("utf-8")), ts)
+
+def stdlib_loads(body, ts):
+    # parse_power_data without orjson
+    return model.SampleData(json.loads(body), ts)
+
+def orjson_loads(body, ts):
+    return model.SampleData(model.orjson.loads(body), ts)
+
+def fingerprint(data):
+    return [
+        (measurement_type, idx, [getattr(line, k) for k in model.PowerSample.__slots__])
+        for measurement_type, idx, line in data.iter_lines()
+    ]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=3)
+    parser.add_argument("--payload", help="Recorded production.json?details=1 response")
+    parser.add_argument("--count", type=int, default=5000)
+    args = parser.parse_args()
+
+    if args.payload:
+        with open(args.payload, "rb") as f:
+            body = f.read()
+    else:
+        body = json.dumps(make_production_json(args.lines)).encode("utf-8")
+    ts = datetime.now(timezone.utc)
+
+    paths = [("response.json()", response_json), ("json.loads", stdlib_loads)]
+    if model.orjson is not None:
+        paths.append(("orjson", orjson_loads))
+    else:
+        print("orjson is not installed")
+
+    expected = fingerprint(response_json(body, ts))
+    print(f"Payload: {len(body)} bytes, {len(expected)} lines")
+
+    baseline = None
+    for name, parse in paths:
+        if fingerprint(parse(body, ts)) != expected:
+            print(f"{name}: MISMATCH")
+            continue
+        t = min(timeit.repeat(lambda: parse(body, ts), number=args.count, repeat=3)) / args.count
+        baseline = baseline or t
+        print(f"{name:16s} {t * 1e6:8.1f} us/sample ({baseline / t:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Synthetic Envoy API payloads for benchmarking
+"""
+import random
+import time
+
+LINE_KEYS = [
+    "wNow", "rmsCurrent", "rmsVoltage", "reactPwr", "apprntPwr",
+    "whToday", "vahToday", "varhLagToday", "varhLeadToday",
+    "whLifetime", "vahLifetime", "varhLagLifetime", "varhLeadLifetime",
+    "whLastSevenDays",
+]
+
+def make_eim(measurement_type, n_lines):
+    lines = []
+    for _ in range(n_lines):
+        lines.append({k: random.uniform(-5000, 5000) for k in LINE_KEYS})
+    # Envoy reports whole numbers as integers sometimes
+    lines[0]["wNow"] = 0
+    eim = {
+        "type": "eim",
+        "activeCount": 1,
+        "measurementType": measurement_type,
+        "readingTime": int(time.time()),
+        "lines": lines,
+    }
+    # Totals that are reported alongside the lines
+    for k in LINE_KEYS:
+        eim[k] = sum(line[k] for line in lines)
+    return eim
+
+def make_production_json(n_lines=2, n_inverters=0):
+    """
+    Equivalent of production.json?details=1
+    """
+    return {
+        "production": [
+            {
+                "type": "inverters",
+                "activeCount": n_inverters,
+                "readingTime": int(time.time()),
+                "wNow": random.randint(0, 300 * max(n_inverters, 1)),
+                "whLifetime": random.randint(0, 10**8),
+            },
+            make_eim("production", n_lines),
+        ],
+        "consumption": [
+            make_eim("total-consumption", n_lines),
+            make_eim("net-consumption", n_lines),
+        ],
+        "storage": [
+            {"type": "acb", "activeCount": 0, "readingTime": 0, "wNow": 0, "whNow": 0, "state": "idle"},
+        ],
+    }
+
+def make_inverters_json(n_inverters, report_ts=None):
+    """
+    Equivalent of /api/v1/production/inverters
+    """
+    if report_ts is None:
+        report_ts = int(time.time())
+    return [
+        {
+            "serialNumber": str(202200000000 + i),
+            "lastReportDate": report_ts - random.randint(0, 300),
+            "devType": 1,
+            "lastReportWatts": random.randint(0, 300),
+            "maxReportWatts": 300,
+        }
+        for i in range(n_inverters)
+    ]
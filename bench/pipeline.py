@@ -0,0 +1,190 @@
+"""
+End-to-end benchmark of the logging pipeline against local fake Envoys and a
+fake InfluxDB.
+
+Each simulated gateway runs the same stages as SamplingLoop, back to back
+rather than waiting for the sampling interval:
+    http:    Envoy requests (production.json + inverters)
+    parse:   JSON decode and building the sample model
+    process: Inverter filtering, encoding, energy/downsampling and queueing
+Points then flow through the writer, spool and replay worker into the fake
+InfluxDB. Throughput is measured until InfluxDB has received every point.
+
+Usage:
+    python bench/pipeline.py [--gateways N] [--ticks N] [--lines N] [--inverters N]
+                             [--latency S] [--workers N] [--trace-alloc]
+"""
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import argparse
+import statistics
+import tracemalloc
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from influxdb_client import InfluxDBClient, WritePrecision
+from influxdb_client.client.write_api import SYNCHRONOUS
+
+from envoy_logger.cfg import Config
+from envoy_logger.enphaseenergy import TokenManager
+from envoy_logger.model import loads, parse_power_data
+from envoy_logger.sampling_loop import SamplingLoop
+from envoy_logger.writer import BatchWriter
+from envoy_logger.spool import Spool, SpoolReplayer
+
+from fake_envoy import FakeEnvoy, FakeInfluxDB
+
+STAGES = ("http", "parse", "process")
+
+class Stopwatch:
+    """
+    Times each stage, and optionally how much memory it allocates
+    """
+    def __init__(self, trace_alloc: bool) -> None:
+        self.trace_alloc = trace_alloc
+        self.times = {} # type: Dict[str, float]
+        self.allocs = {} # type: Dict[str, int]
+        self._t = time.perf_counter()
+        if trace_alloc:
+            tracemalloc.reset_peak()
+            self._mem = tracemalloc.get_traced_memory()[0]
+
+    def lap(self, stage: str) -> None:
+        t = time.perf_counter()
+        self.times[stage] = t - self._t
+        if self.trace_alloc:
+            current, peak = tracemalloc.get_traced_memory()
+            self.allocs[stage] = peak - self._mem
+            tracemalloc.reset_peak()
+            self._mem = current
+        self._t = time.perf_counter()
+
+
+def run_tick(S: SamplingLoop, trace_alloc: bool) -> Stopwatch:
+    sw = Stopwatch(trace_alloc)
+
+    power_response = S.envoy.session.get(f"{S.envoy.url}/production.json?details=1", timeout=30)
+    power_response.raise_for_status()
+    inverter_response = S.envoy.session.get(f"{S.envoy.url}/api/v1/production/inverters", timeout=30)
+    inverter_response.raise_for_status()
+    power_body = power_response.content
+    inverter_body = inverter_response.content
+    sw.lap("http")
+
+    ts = datetime.now(timezone.utc)
+    data = parse_power_data(power_body, ts)
+    inverter_reports = loads(inverter_body)
+    sw.lap("parse")
+
+    new_inverter_data = S.inverter_table.update(inverter_reports, ts)
+    S.write_to_influxdb(data, new_inverter_data)
+    sw.lap("process")
+
+    return sw
+
+
+def summarize(name: str, values: List[float], scale: float, unit: str) -> str:
+    values = sorted(values)
+    p95 = values[int(len(values) * 0.95) - 1] if len(values) >= 20 else values[-1]
+    return (
+        f"{name:8s} mean {statistics.mean(values) * scale:9.2f} {unit}"
+        f"  p50 {statistics.median(values) * scale:9.2f} {unit}"
+        f"  p95 {p95 * scale:9.2f} {unit}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--gateways", type=int, default=1)
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=2)
+    parser.add_argument("--inverters", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated Envoy latency (s)")
+    parser.add_argument("--workers", type=int, default=16, help="Gateways sampled concurrently")
+    parser.add_argument("--trace-alloc", action="store_true", help="Measure memory allocated per stage (runs single-threaded)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    workers = 1 if args.trace_alloc else min(args.workers, args.gateways)
+
+    envoy = FakeEnvoy(n_lines=args.lines, n_inverters=args.inverters, latency=args.latency).start()
+    influxdb = FakeInfluxDB().start()
+    influxdb.keep_lines = False
+    tmp_dir = tempfile.mkdtemp(prefix="envoy-logger-bench-")
+
+    cfg = Config({
+        "enphaseenergy": {"email": "", "password": ""},
+        "envoys": [
+            {"serial": str(i), "url": f"{envoy.url}/gw{i}", "tag": f"gw{i}", "pool_size": 2}
+            for i in range(args.gateways)
+        ],
+        "influxdb": {"url": influxdb.url, "token": "", "bucket": "bench"},
+        "spool": {"path": os.path.join(tmp_dir, "spool")},
+        "daily_summary": {"checkpoint_dir": os.path.join(tmp_dir, "energy")},
+    })
+
+    influxdb_client = InfluxDBClient(url=cfg.influxdb_url, token=cfg.influxdb_token, org=cfg.influxdb_org)
+    influxdb_write_api = influxdb_client.write_api(write_options=SYNCHRONOUS)
+    spool = Spool(cfg.spool_path)
+    SpoolReplayer(
+        spool,
+        lambda bucket, records: influxdb_write_api.write(
+            bucket=bucket, record=records, write_precision=WritePrecision.MS
+        ),
+        rate=10**9,
+        poll_interval=0.05,
+    )
+    writer = BatchWriter(spool.append, flush_interval=0.1)
+
+    loops = [
+        SamplingLoop(TokenManager("", "", envoy_cfg.serial, token="fake-token"), cfg, envoy_cfg, influxdb_client, writer)
+        for envoy_cfg in cfg.envoys
+    ]
+
+    if args.trace_alloc:
+        tracemalloc.start()
+
+    stopwatches = [] # type: List[Stopwatch]
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in range(args.ticks):
+            stopwatches.extend(executor.map(lambda S: run_tick(S, args.trace_alloc), loops))
+    t_sampled = time.perf_counter()
+
+    # Wait for everything to land in InfluxDB
+    writer.close()
+    while spool.size:
+        time.sleep(0.01)
+    t_done = time.perf_counter()
+
+    if args.trace_alloc:
+        tracemalloc.stop()
+
+    n_samples = args.ticks * args.gateways
+    print(f"{args.gateways} gateways x {args.ticks} ticks, {args.lines} lines per phase type, "
+          f"{args.inverters} inverters, {workers} workers")
+    print(f"Sampling:   {n_samples / (t_sampled - t_start):10.1f} samples/s")
+    print(f"End-to-end: {n_samples / (t_done - t_start):10.1f} samples/s "
+          f"({influxdb.line_count} lines in {influxdb.write_count} writes)")
+    print(f"Envoy connections opened: {sum(S.envoy.connection_count for S in loops)}")
+    print("Per-stage latency:")
+    for stage in STAGES:
+        print("  " + summarize(stage, [sw.times[stage] for sw in stopwatches], 1e3, "ms"))
+    if args.trace_alloc:
+        print("Per-stage allocations (peak):")
+        for stage in STAGES:
+            print("  " + summarize(stage, [sw.allocs[stage] for sw in stopwatches], 1 / 1024, "KiB"))
+
+    envoy.stop()
+    influxdb.stop()
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Measure how much memory it takes to hold a window of recent samples.
+
+The current (__slots__) model is compared against an equivalent dict-backed
+object layout, which is how the model used to be implemented.
+
+Usage:
+    python bench/sample_memory.py [--lines N] [--inverters N] [--interval S] [--window S]
+"""
+import os
+import sys
+import argparse
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from envoy_logger import model
+
+from payloads import make_production_json, make_inverters_json
+
+
+class DictBacked:
+    """
+    Plain object that stores its attributes in a __dict__
+    """
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def dict_backed_sample(data, ts):
+    eims = {}
+    for group in ("consumption", "production"):
+        for eim_data in data[group]:
+            if eim_data["type"] != "eim":
+                continue
+            eim = DictBacked(ts=ts, lines=[])
+            for line_data in eim_data["lines"]:
+                line = DictBacked(parent=eim, ts=ts, **{k: line_data[k] for k in model.PowerSample.__slots__ if k != "ts"})
+                eim.lines.append(line)
+            eims[eim_data["measurementType"]] = eim
+    return DictBacked(
+        ts=ts,
+        net_consumption=eims.get("net-consumption"),
+        total_consumption=eims.get("total-consumption"),
+        total_production=eims.get("production"),
+    )
+
+def dict_backed_inverter(data, ts):
+    return DictBacked(
+        ts=ts,
+        serial=data["serialNumber"],
+        report_ts=data["lastReportDate"],
+        watts=data["lastReportWatts"],
+    )
+
+def measure(n_samples, payload, inverter_payload, make_sample, make_inverter):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    samples = []
+    for _ in range(n_samples):
+        ts = datetime.now(timezone.utc)
+        samples.append((
+            make_sample(payload, ts),
+            [make_inverter(d, ts) for d in inverter_payload],
+        ))
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=3)
+    parser.add_argument("--inverters", type=int, default=0)
+    parser.add_argument("--interval", type=float, default=5)
+    parser.add_argument("--window", type=float, default=3600)
+    args = parser.parse_args()
+
+    n_samples = int(args.window / args.interval)
+    payload = make_production_json(args.lines, args.inverters)
+    inverter_payload = make_inverters_json(args.inverters)
+
+    slotted = measure(n_samples, payload, inverter_payload, model.SampleData, model.InverterSample)
+    dict_backed = measure(n_samples, payload, inverter_payload, dict_backed_sample, dict_backed_inverter)
+
+    print(f"{n_samples} samples ({args.lines} lines per phase type, {args.inverters} inverters)")
+    print(f"dict-backed: {dict_backed / 1024:8.1f} KiB ({dict_backed / n_samples:.0f} B/sample)")
+    print(f"__slots__:   {slotted / 1024:8.1f} KiB ({slotted / n_samples:.0f} B/sample)")
+    print(f"Ratio: {slotted / dict_backed:.2f}")
+
+if __name__ == "__main__":
+    main()
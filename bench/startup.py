@@ -0,0 +1,121 @@
+"""
+Measure how long the logger takes from process start to the first point
+landing in InfluxDB, against a local fake Envoy and fake InfluxDB.
+
+Each run launches "python -m envoy_logger" with a fresh cache directory, a
+cached (fake) token, and an empty spool, then waits for FakeInfluxDB to
+receive its first write.
+
+Besides imports and setup, the time includes waiting for the first aligned
+sampling tick (up to --interval), and the writer's flush interval
+(--flush-interval).
+
+Usage:
+    python bench/startup.py [--runs N] [--interval S] [--flush-interval S]
+"""
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import tempfile
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from fake_envoy import FakeEnvoy, FakeInfluxDB
+
+SERIAL = "123456789012"
+
+def make_token() -> str:
+    def segment(d):
+        return base64.urlsafe_b64encode(json.dumps(d).encode("utf-8")).decode("ascii").rstrip("=")
+    return ".".join((
+        segment({"alg": "none"}),
+        segment({"exp": int(time.time()) + 365 * 86400}),
+        "signature",
+    ))
+
+def write_cfg(path: str, envoy_url: str, influxdb_url: str, args) -> None:
+    cfg = {
+        "enphaseenergy": {"email": "", "password": ""},
+        "envoy": {"serial": SERIAL, "url": envoy_url, "tag": "bench"},
+        "influxdb": {
+            "url": influxdb_url,
+            "token": "",
+            "org": "bench",
+            "bucket": "bench",
+            "flush_interval": args.flush_interval,
+        },
+        "sampling": {"interval": args.interval},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(cfg, f)
+
+def time_imports(env) -> float:
+    t = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", "import envoy_logger.sampling_loop, envoy_logger.sinks, envoy_logger.spool, envoy_logger.recent"],
+        env=env, cwd=ROOT, check=True,
+    )
+    return time.perf_counter() - t
+
+def run_once(envoy: FakeEnvoy, influxdb: FakeInfluxDB, args) -> float:
+    tmp_dir = tempfile.mkdtemp(prefix="envoy-logger-startup-")
+    try:
+        token_dir = os.path.join(tmp_dir, "enphase-envoy")
+        os.makedirs(token_dir)
+        with open(os.path.join(token_dir, f"{SERIAL}.token"), "w", encoding="utf-8") as f:
+            f.write(make_token())
+        cfg_path = os.path.join(tmp_dir, "cfg.yaml")
+        write_cfg(cfg_path, envoy.url, influxdb.url, args)
+
+        env = dict(os.environ, XDG_CACHE_HOME=tmp_dir, PYTHONPATH=ROOT)
+        write_count = influxdb.write_count
+        t = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "envoy_logger", cfg_path],
+            env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            while influxdb.write_count == write_count:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"Logger exited with code {proc.returncode}")
+                if time.perf_counter() - t > args.timeout:
+                    raise RuntimeError("Timed out waiting for the first point")
+                time.sleep(0.005)
+            return time.perf_counter() - t
+        finally:
+            proc.kill()
+            proc.wait()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--interval", type=float, default=0.1, help="Sampling interval (s)")
+    parser.add_argument("--flush-interval", type=float, default=0.05, help="Writer flush interval (s)")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    envoy = FakeEnvoy().start()
+    influxdb = FakeInfluxDB().start()
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    imports = [time_imports(env) for _ in range(args.runs)]
+    print(f"Import (incl. interpreter start): median {statistics.median(imports) * 1e3:7.1f} ms")
+
+    times = [run_once(envoy, influxdb, args) for _ in range(args.runs)]
+    print(f"Process start to first point:     median {statistics.median(times) * 1e3:7.1f} ms"
+          f"  min {min(times) * 1e3:7.1f} ms  max {max(times) * 1e3:7.1f} ms  ({args.runs} runs)")
+
+    envoy.stop()
+    influxdb.stop()
+
+if __name__ == "__main__":
+    main()
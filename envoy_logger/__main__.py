@@ -1,12 +1,21 @@
 import logging
 import argparse
+import threading
 import time
+import sys
 
 from requests.exceptions import RequestException
 
 from . import enphaseenergy
 from .sampling_loop import SamplingLoop
-from .cfg import load_cfg
+from .cfg import load_cfg, EnvoyConfig
+from .sinks import SinkSet, make_sink
+from .spool import Spool, SpoolReplayer
+from .http_api import HttpApi
+from .recent import LiveData
+from .database import InfluxDBConnection
+from .backoff import Backoff
+from . import metrics
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,20 +28,132 @@ args = parser.parse_args()
 
 cfg = load_cfg(args.cfg_path)
 
-while True:
-    # Loop forever so that if an exception occurs, logger will restart
+# The database connection and write queue outlive restarts of the sampling loop
+# so that queued points are not lost.
+# The client is set up in the background while the first samples are taken
+influxdb_client = InfluxDBConnection(
+    url=cfg.influxdb_url,
+    token=cfg.influxdb_token,
+    org=cfg.influxdb_org
+)
+influxdb_client.connect_async()
+
+# Daily summary queries can take a lot longer than writes, so they get their
+# own client with its own timeout. Only created once a query is run
+influxdb_query_client = InfluxDBConnection(
+    url=cfg.influxdb_url,
+    token=cfg.influxdb_token,
+    org=cfg.influxdb_org,
+    timeout=int(cfg.daily_summary_query_timeout * 1000),
+)
+
+# Points go through an on-disk spool on their way to InfluxDB so that they
+# survive database outages and restarts
+spool = Spool(
+    cfg.spool_path,
+    segment_size=cfg.spool_segment_size,
+    max_size=cfg.spool_max_size,
+)
+def write_to_influxdb(bucket, records):
+    with metrics.INFLUXDB_WRITE_SECONDS.labels().time():
+        influxdb_client.write(bucket, records)
+
+SpoolReplayer(spool, write_to_influxdb, rate=cfg.spool_replay_rate)
+
+# Points are fanned out to InfluxDB and any other configured outputs, each
+# with its own write queue
+writer = SinkSet()
+writer.add(
+    "influxdb",
+    spool.append,
+    batch_size=cfg.influxdb_batch_size,
+    flush_interval=cfg.influxdb_flush_interval,
+    queue_size=cfg.influxdb_queue_size,
+    overflow=cfg.influxdb_overflow,
+)
+for output_cfg in cfg.outputs:
+    writer.add(
+        output_cfg.kind,
+        make_sink(output_cfg),
+        buckets=output_cfg.buckets,
+        batch_size=output_cfg.batch_size,
+        flush_interval=output_cfg.flush_interval,
+        queue_size=output_cfg.queue_size,
+        overflow=output_cfg.overflow,
+    )
+
+metrics.SPOOL_BYTES.labels().set_function(lambda: spool.size)
+if cfg.metrics_bucket:
+    metrics.InfluxDBExporter(writer, cfg.metrics_bucket, cfg.metrics_interval)
+
+# Recent samples are kept in memory, and outlive restarts of the sampling loop
+live = None
+if cfg.http_api_port:
+    http_api = HttpApi(cfg.http_api_bind, cfg.http_api_port)
+    http_api.add_route("/metrics", lambda query: (
+        "text/plain; version=0.0.4; charset=utf-8",
+        metrics.expose().encode("utf-8"),
+    ))
+    if cfg.live_history:
+        live = LiveData(cfg)
+        live.add_routes(http_api)
+    http_api.start()
+
+def run_envoy(envoy_cfg: EnvoyConfig) -> None:
+    # The token is kept fresh in the background. Once created, the sampling
+    # loop is kept too, along with its envoy session and accumulated state, so
+    # restarting only needs to resume sampling.
+    token_manager = None
+    S = None
+    backoff = Backoff(cfg.restart_min_delay, cfg.restart_max_delay)
     try:
-        envoy_token = enphaseenergy.get_token(
-            cfg.enphase_email,
-            cfg.enphase_password,
-            cfg.envoy_serial
-        )
-
-        S = SamplingLoop(envoy_token, cfg)
-
-        S.run()
-    except RequestException as e:
-        logging.error("%s: %s", str(type(e)), e)
-        logging.info("Waiting a bit before restarting...")
-        time.sleep(15)
-        logging.info("Restarting data logger")
+        while True:
+            # Loop forever so that if an exception occurs, logger will restart
+            t_start = time.monotonic()
+            try:
+                if token_manager is None:
+                    token_manager = enphaseenergy.TokenManager(
+                        cfg.enphase_email,
+                        cfg.enphase_password,
+                        envoy_cfg.serial
+                    )
+                    token_manager.start()
+
+                if S is None:
+                    recent = live.get(envoy_cfg) if live is not None else None
+                    S = SamplingLoop(token_manager, cfg, envoy_cfg, influxdb_query_client, writer, recent)
+                S.run()
+            except RequestException as e:
+                if time.monotonic() - t_start > backoff.max_delay:
+                    # Was running fine for a while. Start backing off from scratch
+                    backoff.reset()
+                delay = backoff.next_delay()
+                logging.error("%s: %s", str(type(e)), e)
+                logging.info("Waiting %.1f s before restarting...", delay)
+                time.sleep(delay)
+                logging.info("Restarting data logger for envoy: %s", envoy_cfg.url)
+    finally:
+        if S is not None:
+            S.close()
+
+# Each envoy is sampled from its own thread so that a slow or offline envoy
+# does not stall the others. They all share the same writer.
+threads = []
+for envoy_cfg in cfg.envoys:
+    t = threading.Thread(
+        target=run_envoy,
+        args=(envoy_cfg,),
+        name=f"envoy-{envoy_cfg.serial}",
+        daemon=True,
+    )
+    t.start()
+    threads.append(t)
+
+while all(t.is_alive() for t in threads):
+    time.sleep(1)
+
+# A sampling thread died from an unexpected exception. Exit and let the service
+# manager restart everything.
+logging.error("Sampling thread exited unexpectedly")
+writer.close(timeout=10)
+sys.exit(1)
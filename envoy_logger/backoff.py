@@ -0,0 +1,22 @@
+import random
+
+class Backoff:
+    """
+    Jittered exponential backoff.
+
+    Each delay doubles, up to max_delay. Half of it is randomized, so that
+    envoys that failed together do not all retry at the same moment.
+    """
+    def __init__(self, min_delay: float = 1, max_delay: float = 120) -> None:
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.attempt = 0
+
+    def reset(self) -> None:
+        self.attempt = 0
+
+    def next_delay(self) -> float:
+        delay = min(self.min_delay * 2 ** self.attempt, self.max_delay)
+        if delay < self.max_delay:
+            self.attempt += 1
+        return delay / 2 + random.uniform(0, delay / 2)
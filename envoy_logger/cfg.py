@@ -1,9 +1,15 @@
 import logging
+import os
 import sys
-from typing import Dict
+from typing import Dict, List, Optional, TYPE_CHECKING
 
 import yaml
-from influxdb_client import Point
+from appdirs import user_cache_dir
+
+from .inventory import INVENTORY_TAGS
+
+if TYPE_CHECKING:
+    from influxdb_client import Point
 
 LOG = logging.getLogger("cfg")
 
@@ -13,9 +19,26 @@ class Config:
             self.enphase_email = data['enphaseenergy']['email'] # type: str
             self.enphase_password = data['enphaseenergy']['password'] # type: str
 
-            self.envoy_serial = str(data['envoy']['serial'])
-            self.envoy_url = data['envoy'].get('url', 'https://envoy.local') # type: str
-            self.source_tag = data['envoy'].get('tag', 'envoy') # type: str
+            # Inverter tags are shared by all envoys. Inverter serial numbers
+            # are unique, so there is no risk of them colliding
+            inverters = {} # type: Dict[str, InverterConfig]
+            for serial, inverter_data in data.get("inverters", {}).items():
+                serial = str(serial)
+                inverters[serial] = InverterConfig(inverter_data, serial)
+
+            # Either a single 'envoy' or a list of 'envoys'
+            if 'envoys' in data:
+                envoys_data = data['envoys']
+            else:
+                envoys_data = [data['envoy']]
+            self.envoys = [] # type: List[EnvoyConfig]
+            for envoy_data in envoys_data:
+                self.envoys.append(EnvoyConfig(envoy_data, inverters))
+
+            source_tags = [envoy.source_tag for envoy in self.envoys]
+            if len(set(source_tags)) != len(source_tags):
+                LOG.error("Each envoy needs a unique tag")
+                sys.exit(1)
 
             self.influxdb_url = data['influxdb']['url'] # type: str
             self.influxdb_token = data['influxdb']['token'] # type: str
@@ -27,20 +50,201 @@ class Config:
             self.influxdb_bucket_lr = bucket_lr or bucket
             self.influxdb_bucket_hr = bucket_hr or bucket
 
-            self.inverters = {} # type: Dict[str, InverterConfig]
-            for serial, inverter_data in data.get("inverters", {}).items():
-                serial = str(serial)
-                self.inverters[serial] = InverterConfig(inverter_data, serial)
+            # Sampling schedule
+            sampling = data.get('sampling', {})
+            self.sampling_interval = parse_duration(sampling.get('interval', 5)) # type: float
+            self.sampling_overrun_policy = sampling.get('overrun_policy', 'skip') # type: str
+            if self.sampling_interval <= 0:
+                LOG.error("Invalid sampling interval: %s", self.sampling_interval)
+                sys.exit(1)
+            if self.sampling_overrun_policy not in ("skip", "catch-up"):
+                LOG.error("Invalid sampling overrun_policy: %s", self.sampling_overrun_policy)
+                sys.exit(1)
+            # Adaptive sampling. Slows down to max_interval while power is
+            # steady. Disabled unless max_interval is set
+            self.sampling_max_interval = parse_duration(sampling.get('max_interval', self.sampling_interval)) # type: float
+            self.sampling_change_threshold = sampling.get('change_threshold', 50) # type: float
+            if self.sampling_max_interval < self.sampling_interval:
+                LOG.error("Sampling max_interval must not be shorter than interval")
+                sys.exit(1)
+
+            # Points are queued and written in batches in the background
+            self.influxdb_batch_size = data['influxdb'].get('batch_size', 500) # type: int
+            self.influxdb_flush_interval = data['influxdb'].get('flush_interval', 1.0) # type: float
+            self.influxdb_queue_size = data['influxdb'].get('queue_size', 10000) # type: int
+            self.influxdb_overflow = data['influxdb'].get('overflow', 'drop-oldest') # type: str
+            if self.influxdb_overflow not in ("drop-oldest", "block"):
+                LOG.error("Invalid influxdb overflow policy: %s", self.influxdb_overflow)
+                sys.exit(1)
+
+            # All points are spooled to disk before being sent to InfluxDB
+            spool = data.get('spool', {})
+            self.spool_path = os.path.expanduser(
+                spool.get('path', os.path.join(user_cache_dir("envoy-logger"), "spool"))
+            ) # type: str
+            self.spool_segment_size = spool.get('segment_size', 4 * 1024 * 1024) # type: int
+            self.spool_max_size = spool.get('max_size', 1024 * 1024 * 1024) # type: int
+            self.spool_replay_rate = spool.get('replay_rate', 5000) # type: float
+
+            # How the daily totals are computed:
+            #   "accumulate": Integrate power as samples arrive
+            #   "flux": Query InfluxDB for the integral of the prior day
+            #   "verify": Accumulate, but also check the result against the Flux query
+            daily_summary = data.get('daily_summary', {})
+            self.daily_summary_mode = daily_summary.get('mode', 'accumulate') # type: str
+            if self.daily_summary_mode not in ("accumulate", "flux", "verify"):
+                LOG.error("Invalid daily_summary mode: %s", self.daily_summary_mode)
+                sys.exit(1)
+            self.daily_summary_checkpoint_dir = os.path.expanduser(
+                daily_summary.get('checkpoint_dir', os.path.join(user_cache_dir("envoy-logger"), "energy"))
+            ) # type: str
+            self.daily_summary_checkpoint_interval = daily_summary.get('checkpoint_interval', 60) # type: float
+            # Flux queries are split up and run in parallel
+            self.daily_summary_query_timeout = parse_duration(daily_summary.get('query_timeout', 120)) # type: float
+            self.daily_summary_query_retries = daily_summary.get('query_retries', 2) # type: int
+            self.daily_summary_query_workers = daily_summary.get('query_workers', 4) # type: int
+            self.daily_summary_serial_group_size = daily_summary.get('serial_group_size', 50) # type: int
+
+            # Write derived fields (power factor, phase angle) and per
+            # measurement type totals along with each sample
+            self.derived_fields = data.get('derived_fields', True) # type: bool
+
+            # Optionally skip high-rate line points that barely changed
+            deadband = data.get('deadband', {})
+            self.deadband_thresholds = deadband.get('fields', {}) # type: Dict[str, float]
+            self.deadband_max_silence = parse_duration(deadband.get('max_silence', 300)) # type: float
+
+            # Rebuild energy over gaps in the data (logger was down). Disabled
+            # unless configured
+            backfill = data.get('backfill', None)
+            self.backfill_min_gap = None # type: Optional[float]
+            self.backfill_resolution = 60.0 # type: float
+            if backfill is not None:
+                self.backfill_min_gap = parse_duration(backfill.get('min_gap', 60))
+                self.backfill_resolution = parse_duration(backfill.get('resolution', 60))
+                if self.backfill_min_gap <= self.sampling_max_interval:
+                    LOG.error("Backfill min_gap must be longer than the sampling max_interval")
+                    sys.exit(1)
+
+            # The envoy's device inventory is periodically refreshed, and can
+            # add metadata tags to inverter points
+            inventory = data.get('inventory', {})
+            self.inventory_refresh_interval = parse_duration(inventory.get('refresh_interval', 3600)) # type: float
+            self.inventory_tags = inventory.get('tags', []) # type: List[str]
+            for name in self.inventory_tags:
+                if name not in INVENTORY_TAGS:
+                    LOG.error("Unknown inventory tag: %s", name)
+                    sys.exit(1)
+
+            # Inverters only report every few minutes, so their endpoint is
+            # only requested when new reports are expected ("cadence"), or on
+            # every sample ("every-tick")
+            inverter_polling = data.get('inverter_polling', {})
+            self.inverter_poll_mode = inverter_polling.get('mode', 'cadence') # type: str
+            self.inverter_poll_min_interval = parse_duration(inverter_polling.get('min_interval', 30)) # type: float
+            self.inverter_poll_safety_interval = parse_duration(inverter_polling.get('safety_interval', 900)) # type: float
+            if self.inverter_poll_mode not in ("cadence", "every-tick"):
+                LOG.error("Invalid inverter_polling mode: %s", self.inverter_poll_mode)
+                sys.exit(1)
+
+            # After an error, sampling is restarted with an exponential backoff
+            restart = data.get('restart', {})
+            self.restart_min_delay = parse_duration(restart.get('min_delay', 1)) # type: float
+            self.restart_max_delay = parse_duration(restart.get('max_delay', 120)) # type: float
+
+            # Local HTTP server for status endpoints. Disabled unless a port is set
+            http_api = data.get('http_api', {})
+            self.http_api_bind = http_api.get('bind', '127.0.0.1') # type: str
+            self.http_api_port = http_api.get('port', None) # type: Optional[int]
+            # How much history of recent samples to keep in memory for the
+            # /live endpoints. 0 to disable
+            self.live_history = parse_duration(http_api.get('live_history', 3600)) # type: float
+
+            # Optionally write the logger's own metrics to InfluxDB
+            metrics = data.get('metrics', {})
+            self.metrics_bucket = metrics.get('bucket', None) # type: Optional[str]
+            self.metrics_interval = parse_duration(metrics.get('interval', 60)) # type: float
+
+            # Other outputs that points are written to, alongside InfluxDB
+            self.outputs = [] # type: List[OutputConfig]
+            for kind, output_data in data.get('outputs', {}).items():
+                self.outputs.append(OutputConfig(kind, output_data))
+
+            # Additional lower-resolution tiers of the high-rate data
+            self.downsample_tiers = [] # type: List[DownsampleConfig]
+            for tier_data in data.get('downsample', []):
+                self.downsample_tiers.append(DownsampleConfig(tier_data))
 
         except KeyError as e:
             LOG.error("Missing required config key: %s", e.args[0])
             sys.exit(1)
 
 
-    def apply_tags_to_inverter_point(self, p: Point, serial: str) -> None:
-        if serial in self.inverters.keys():
-            self.inverters[serial].apply_tags_to_point(p)
+class DownsampleConfig:
+    def __init__(self, data) -> None:
+        self.window = parse_duration(data['window']) # type: float
+        self.bucket = data['bucket'] # type: str
+
+
+class OutputConfig:
+    KINDS = ("stdout", "sqlite", "mqtt")
+
+    def __init__(self, kind: str, data) -> None:
+        if kind not in self.KINDS:
+            LOG.error("Unknown output: %s", kind)
+            sys.exit(1)
+        # Allow "stdout: true" or an empty section
+        if not isinstance(data, dict):
+            data = {}
+        self.kind = kind
+
+        # Only write these buckets to the output. Defaults to all
+        self.buckets = data.get('buckets', None) # type: Optional[List[str]]
+
+        # Each output is batched separately
+        self.batch_size = data.get('batch_size', 500) # type: int
+        self.flush_interval = data.get('flush_interval', 1.0) # type: float
+        self.queue_size = data.get('queue_size', 10000) # type: int
+        self.overflow = data.get('overflow', 'drop-oldest') # type: str
+        if self.overflow not in ("drop-oldest", "block"):
+            LOG.error("Invalid overflow policy for %s output: %s", kind, self.overflow)
+            sys.exit(1)
+
+        # sqlite
+        self.path = None # type: Optional[str]
+        if kind == "sqlite":
+            self.path = os.path.expanduser(data['path'])
+
+        # mqtt
+        self.host = None # type: Optional[str]
+        if kind == "mqtt":
+            self.host = data['host']
+        self.port = data.get('port', 1883) # type: int
+        self.topic_prefix = data.get('topic_prefix', 'envoy-logger') # type: str
+        self.username = data.get('username', None) # type: Optional[str]
+        self.password = data.get('password', None) # type: Optional[str]
+        self.qos = data.get('qos', 0) # type: int
+        self.retain = data.get('retain', False) # type: bool
+
 
+class EnvoyConfig:
+    def __init__(self, data, inverters: Dict[str, 'InverterConfig']) -> None:
+        self.serial = str(data['serial'])
+        self.url = data.get('url', 'https://envoy.local') # type: str
+        self.source_tag = data.get('tag', 'envoy') # type: str
+        self.pool_size = data.get('pool_size', 4) # type: int
+        self.retries = data.get('retries', 2) # type: int
+
+        # Global inverter tags, plus any that are listed under this envoy
+        self.inverters = dict(inverters) # type: Dict[str, InverterConfig]
+        for serial, inverter_data in data.get("inverters", {}).items():
+            serial = str(serial)
+            self.inverters[serial] = InverterConfig(inverter_data, serial)
+
+    def apply_tags_to_inverter_point(self, p: 'Point', serial: str) -> None:
+        inverter_cfg = self.inverters.get(serial)
+        if inverter_cfg is not None:
+            inverter_cfg.apply_tags_to_point(p)
 
 
 class InverterConfig:
@@ -48,11 +252,25 @@ class InverterConfig:
         self.serial = serial
         self.tags = data.get("tags", {})
 
-    def apply_tags_to_point(self, p: Point) -> None:
+    def apply_tags_to_point(self, p: 'Point') -> None:
         for k, v in self.tags.items():
             p.tag(k, v)
 
 
+def parse_duration(value) -> float:
+    """
+    Parse a duration in seconds.
+    Either a plain number, or a string with an s/m/h/d suffix. eg: "15m"
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    value = str(value).strip()
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
 def load_cfg(path: str):
     LOG.info("Loading config: %s", path)
     with open(path, "r", encoding="utf-8") as f:
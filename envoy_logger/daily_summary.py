@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, TYPE_CHECKING
+import re
+import time
+import logging
+
+import urllib3
+
+from .energy import SeriesKey
+
+if TYPE_CHECKING:
+    from influxdb_client import InfluxDBClient
+
+LOG = logging.getLogger("daily_summary")
+
+class DailySummaryQuery:
+    """
+    Computes the prior day's energy by integrating the high-rate points stored
+    in InfluxDB.
+
+    Rather than one query over everything, the work is split into one query
+    per line measurement type, plus one per group of inverter serials. These
+    run in parallel, and each is filtered down as far as possible so that
+    InfluxDB can push the filter down to storage. Results are streamed rather
+    than collected into tables first.
+
+    The client's query API is only set up once a query is run, so that
+    influxdb_client does not need to be imported before then.
+    """
+    LINE_MEASUREMENT_TYPES = ("consumption", "production", "net")
+
+    def __init__(self, influxdb_client: 'InfluxDBClient', bucket: str, source_tag: str, workers: int = 4,
+                 serial_group_size: int = 50, retries: int = 2, retry_delay: float = 10) -> None:
+        self.influxdb_client = influxdb_client
+        self.bucket = bucket
+        self.source_tag = source_tag
+        self.workers = workers
+        self.serial_group_size = serial_group_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    def make_query(self, series_filter: str) -> str:
+        # Not using integral(interpolate:"linear") since it does not do what you
+        # think it would mean. Without the "interoplation" arg, it still does
+        # linear interpolation correctly.
+        # https://github.com/influxdata/flux/issues/4782
+        # Backfilled points are tagged, so they are a separate series. Merge
+        # them back in so that a gap is not counted twice.
+        return f"""
+        from(bucket: "{self.bucket}")
+            |> range(start: -24h, stop: 0h)
+            |> filter(fn: (r) => r["source"] == "{self.source_tag}" and {series_filter} and r["_field"] == "P")
+            |> group(columns: ["_measurement", "line-idx", "measurement-type", "serial"])
+            |> sort(columns: ["_time"])
+            |> integral(unit: 1h)
+            |> keep(columns: ["_value", "line-idx", "measurement-type", "serial"])
+            |> yield(name: "total")
+        """
+
+    def make_queries(self, inverter_serials: Iterable[str]) -> List[str]:
+        queries = []
+        for measurement_type in self.LINE_MEASUREMENT_TYPES:
+            queries.append(self.make_query(f'r["measurement-type"] == "{measurement_type}"'))
+
+        serials = sorted(inverter_serials)
+        for i in range(0, len(serials), self.serial_group_size):
+            group = serials[i:i + self.serial_group_size]
+            pattern = "|".join(re.escape(serial).replace("/", "\\/") for serial in group)
+            queries.append(self.make_query(
+                f'r["measurement-type"] == "inverter" and r["serial"] =~ /^({pattern})$/'
+            ))
+        return queries
+
+    def run_query(self, query: str) -> Dict[SeriesKey, float]:
+        from influxdb_client.rest import ApiException
+
+        query_api = self.influxdb_client.query_api()
+        attempt = 0
+        while True:
+            try:
+                totals = {}
+                for record in query_api.query_stream(query=query):
+                    measurement_type = record['measurement-type']
+                    if measurement_type == "inverter":
+                        key = ("inverter", record['serial'])
+                    else:
+                        key = (measurement_type, record['line-idx'])
+                    totals[key] = record.get_value()
+                return totals
+            except (ApiException, urllib3.exceptions.HTTPError, OSError) as e:
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                LOG.warning("Daily summary query failed (%d/%d): %s", attempt, self.retries, e)
+                time.sleep(self.retry_delay)
+
+    def run(self, inverter_serials: Iterable[str]) -> Dict[SeriesKey, float]:
+        """
+        Query the energy of all lines, and the given inverters
+        """
+        queries = self.make_queries(inverter_serials)
+        totals = {} # type: Dict[SeriesKey, float]
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="daily-summary-query") as executor:
+            for result in executor.map(self.run_query, queries):
+                totals.update(result)
+        return totals
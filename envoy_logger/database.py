@@ -0,0 +1,53 @@
+from typing import Any, List, Optional, TYPE_CHECKING
+import threading
+
+if TYPE_CHECKING:
+    from influxdb_client import InfluxDBClient
+    from influxdb_client.client.query_api import QueryApi
+
+class InfluxDBConnection:
+    """
+    An InfluxDB client that is only created when first needed.
+
+    influxdb_client takes a good fraction of a second to import on small
+    hosts. Deferring it lets sampling start right away. Points wait in the
+    spool until the client is ready.
+    """
+    def __init__(self, url: str, token: str, org: str, timeout: int = None) -> None:
+        self.kwargs = {"url": url, "token": token, "org": org}
+        if timeout is not None:
+            self.kwargs["timeout"] = timeout
+        self._client = None # type: Optional[InfluxDBClient]
+        self._write_api = None # type: Any
+        self._lock = threading.Lock()
+
+    def _connect(self) -> 'InfluxDBClient':
+        # Must hold the lock. Imports from several threads at once can deadlock
+        if self._client is None:
+            from influxdb_client import InfluxDBClient
+            self._client = InfluxDBClient(**self.kwargs)
+        return self._client
+
+    @property
+    def client(self) -> 'InfluxDBClient':
+        with self._lock:
+            return self._connect()
+
+    def connect_async(self) -> None:
+        """
+        Import influxdb_client and create the client in the background
+        """
+        threading.Thread(target=lambda: self.client, name="influxdb-connect", daemon=True).start()
+
+    def query_api(self) -> 'QueryApi':
+        return self.client.query_api()
+
+    def write(self, bucket: str, records: List[str]) -> None:
+        """
+        Write line-protocol records (millisecond precision)
+        """
+        with self._lock:
+            if self._write_api is None:
+                from influxdb_client.client.write_api import SYNCHRONOUS
+                self._write_api = self._connect().write_api(write_options=SYNCHRONOUS)
+        self._write_api.write(bucket=bucket, record=records, write_precision="ms")
@@ -0,0 +1,59 @@
+from typing import Dict, List, Tuple, Any
+
+from .energy import SeriesKey
+
+class DeadbandFilter:
+    """
+    Suppresses points whose values barely changed since the last one written.
+
+    A point is written if any field listed in thresholds moved by at least
+    its threshold since the last written point, or if nothing was written
+    for that series for max_silence seconds.
+    Fields that are not listed in thresholds do not cause a write.
+
+    When a point is written after others were suppressed, the last suppressed
+    point is written first. This keeps the value flat up until the change,
+    rather than letting linear interpolation ramp between the two.
+    """
+    def __init__(self, thresholds: Dict[str, float], max_silence: float = 300) -> None:
+        self.thresholds = thresholds
+        self.max_silence = max_silence
+
+        # Timestamp and field values of the last point written for each series
+        self.last_written = {} # type: Dict[SeriesKey, Tuple[float, Dict[str, Any]]]
+        # Most recent suppressed point for each series
+        self.held = {} # type: Dict[SeriesKey, str]
+
+        self.suppressed_count = 0
+
+    def filter(self, key: SeriesKey, fields: Tuple[Tuple[str, Any], ...], t: float, point: str) -> List[str]:
+        """
+        Returns the points that shall be written for this sample
+        """
+        values = {name: value for name, value in fields if name in self.thresholds}
+
+        last = self.last_written.get(key)
+        if last is not None and t - last[0] < self.max_silence:
+            if not self._changed(last[1], values):
+                self.held[key] = point
+                self.suppressed_count += 1
+                return []
+
+        points = []
+        held = self.held.pop(key, None)
+        if held is not None:
+            points.append(held)
+        points.append(point)
+        self.last_written[key] = (t, values)
+        return points
+
+    def _changed(self, prev: Dict[str, Any], values: Dict[str, Any]) -> bool:
+        for name, value in values.items():
+            prev_value = prev.get(name)
+            if value is None or prev_value is None:
+                if value is not prev_value:
+                    return True
+                continue
+            if abs(value - prev_value) >= self.thresholds[name]:
+                return True
+        return False
@@ -0,0 +1,73 @@
+"""
+Values derived from each sample at ingest time, so that dashboards can read
+them directly rather than computing them from the raw series on every
+refresh.
+"""
+from typing import Dict, Optional
+import math
+
+from .model import SampleData
+
+# Below this, a total is considered noise and ratios are not computed
+MIN_RATIO_POWER = 10.0
+
+def phase_angle(P: float, Q: float) -> Optional[float]:
+    """
+    Angle between real and apparent power, in degrees
+    """
+    if P == 0:
+        return None
+    return math.degrees(math.atan(Q / P))
+
+def power_factor(P: float, S: float) -> float:
+    # Same as PowerSample.pwrFactor
+    if S < MIN_RATIO_POWER:
+        return 1.0
+    return P / S
+
+def compute_totals(data: SampleData) -> Dict[str, Dict[str, float]]:
+    """
+    Sum all lines of each measurement type, in one pass over the sample.
+
+    Returns the fields of each measurement type's total:
+        All: P, Q, S, PF
+        net: P_import and P_export (grid import/export, both positive)
+        production: self_consumption (fraction of production used on-site)
+    """
+    sums = {} # type: Dict[str, list]
+    for measurement_type, _, line in data.iter_lines():
+        s = sums.get(measurement_type)
+        if s is None:
+            s = sums[measurement_type] = [0.0, 0.0, 0.0]
+        s[0] += line.wNow
+        s[1] += line.reactPwr
+        s[2] += line.apprntPwr
+
+    totals = {}
+    for measurement_type, (P, Q, S) in sums.items():
+        totals[measurement_type] = {
+            "P": P,
+            "PF": power_factor(P, S),
+            "Q": Q,
+            "S": S,
+        }
+
+    # Grid import/export
+    if "net" in sums:
+        net_P = sums["net"][0]
+    elif "consumption" in sums and "production" in sums:
+        net_P = sums["consumption"][0] - sums["production"][0]
+    else:
+        net_P = None
+    if net_P is not None and "net" in totals:
+        totals["net"]["P_export"] = max(-net_P, 0.0)
+        totals["net"]["P_import"] = max(net_P, 0.0)
+
+    if net_P is not None and "production" in sums:
+        production_P = sums["production"][0]
+        if production_P >= MIN_RATIO_POWER:
+            exported = max(-net_P, 0.0)
+            ratio = (production_P - exported) / production_P
+            totals["production"]["self_consumption"] = min(max(ratio, 0.0), 1.0)
+
+    return totals
@@ -0,0 +1,166 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple, Any, Optional
+
+from .model import SampleData, InverterSample
+from .cfg import EnvoyConfig
+from .inventory import InventoryIndex
+from .line_protocol import LineEncoder, encode_line
+from .energy import SeriesKey
+from .derived import compute_totals
+
+def format_interval(seconds: float) -> str:
+    """
+    Format a window length the way InfluxDB would. eg: 1m, 15m, 1h
+    """
+    seconds = int(seconds)
+    for unit, length in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds % length == 0:
+            return f"{seconds // length}{unit}"
+    return f"{seconds}s"
+
+
+class _FieldStats:
+    __slots__ = ("count", "total", "min", "max")
+
+    def __init__(self, value: float) -> None:
+        self.count = 1
+        self.total = value
+        self.min = value
+        self.max = value
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+
+class _SeriesWindow:
+    """
+    The open window of one series
+    """
+    __slots__ = ("start", "stats", "Wh", "prev_P")
+
+    def __init__(self, start: float) -> None:
+        self.start = start
+        self.stats = {} # type: Dict[str, _FieldStats]
+        self.Wh = None # type: Optional[float]
+        # Most recent (timestamp, power)
+        self.prev_P = None # type: Optional[Tuple[float, float]]
+
+    def integrate(self, t: float, P: float) -> None:
+        """
+        Add the energy from the previous power reading up to (t, P)
+        """
+        if self.prev_P is not None and t > self.prev_P[0]:
+            prev_t, prev_P = self.prev_P
+            self.Wh = (self.Wh or 0.0) + (prev_P + P) / 2 * (t - prev_t) / 3600
+        elif self.Wh is None:
+            self.Wh = 0.0
+        self.prev_P = (t, P)
+
+
+class DownsampleTier:
+    """
+    Rolling aggregates of the high-rate measurements over a fixed window.
+
+    For every field, the mean, min and max over the window is emitted as
+    <field>_mean, <field>_min and <field>_max. The energy over the window is
+    emitted as Wh.
+    If derived is set, lines include their derived fields, and the
+    "<type>-total" series are aggregated as well.
+    Points are tagged with interval=<window> and timestamped at the end of
+    their window, same as Flux's aggregateWindow().
+
+    Each series' window is closed by its first sample past the end of it.
+    The energy between two samples is split at the window boundaries in
+    between, using the power interpolated there. Inverters only report every
+    few minutes, so windows with no samples of their own still get a point
+    with their share of the energy.
+    """
+    def __init__(self, envoy_cfg: EnvoyConfig, window: float, bucket: str,
+                 inventory: InventoryIndex = None, derived: bool = False) -> None:
+        self.window = window
+        self.bucket = bucket
+        self.encoder = LineEncoder(
+            envoy_cfg,
+            extra_tags={"interval": format_interval(window)},
+            inventory=inventory,
+            derived=derived,
+        )
+        self.series = {} # type: Dict[SeriesKey, _SeriesWindow]
+
+    def add_sample(self, data: SampleData, inverter_data: Dict[str, InverterSample]) -> List[str]:
+        """
+        Add a sample to each series' current window.
+        Returns points summarizing any windows that the sample closed.
+        """
+        points = [] # type: List[str]
+        for measurement_type, idx, line in data.iter_lines():
+            self._add((measurement_type, str(idx)), self.encoder.line_fields(line), line.ts, points)
+        if self.encoder.derived:
+            for measurement_type, fields in compute_totals(data).items():
+                self._add(("total", measurement_type), tuple(fields.items()), data.ts, points)
+        for inverter in inverter_data.values():
+            self._add(("inverter", inverter.serial), self.encoder.inverter_fields(inverter), inverter.ts, points)
+        return points
+
+    def _add(self, key: SeriesKey, fields: Tuple[Tuple[str, Any], ...], ts: datetime, points: List[str]) -> None:
+        t = ts.timestamp()
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = _SeriesWindow(t - (t % self.window))
+
+        P = None
+        for name, value in fields:
+            if name == "P" and value is not None:
+                P = float(value)
+
+        # Close the windows this sample has moved past
+        while t >= series.start + self.window:
+            end = series.start + self.window
+            if P is not None and series.prev_P is not None and t > series.prev_P[0]:
+                prev_t, prev_P = series.prev_P
+                series.integrate(end, prev_P + (P - prev_P) * (end - prev_t) / (t - prev_t))
+            point = self._close_window(key, series)
+            if point is not None:
+                points.append(point)
+            series.start = end
+
+        for name, value in fields:
+            if value is None:
+                continue
+            value = float(value)
+            stats = series.stats.get(name)
+            if stats is None:
+                series.stats[name] = _FieldStats(value)
+            else:
+                stats.add(value)
+        if P is not None:
+            series.integrate(t, P)
+
+    def _close_window(self, key: SeriesKey, series: _SeriesWindow) -> Optional[str]:
+        fields = []
+        for name, stats in series.stats.items():
+            fields.append((f"{name}_max", stats.max))
+            fields.append((f"{name}_mean", stats.total / stats.count))
+            fields.append((f"{name}_min", stats.min))
+        if series.Wh is not None:
+            fields.append(("Wh", series.Wh))
+        series.stats = {}
+        series.Wh = None
+        if not fields:
+            return None
+        fields.sort()
+
+        kind, ident = key
+        if kind == "inverter":
+            prefix = self.encoder.inverter_prefix(ident)
+        elif kind == "total":
+            prefix = self.encoder.total_prefix(ident)
+        else:
+            prefix = self.encoder.line_prefix(kind, int(ident))
+        ts = datetime.fromtimestamp(series.start + self.window, timezone.utc)
+        return encode_line(prefix, tuple(fields), ts)
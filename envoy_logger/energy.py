@@ -0,0 +1,148 @@
+from datetime import datetime, date
+from typing import Dict, Tuple, Optional
+import json
+import os
+import time
+import logging
+
+LOG = logging.getLogger("energy")
+
+# Identifies a series being integrated:
+#   ("consumption"|"production"|"net", line index)
+#   ("inverter", serial number)
+#   ("total", measurement type) (downsampling only)
+SeriesKey = Tuple[str, str]
+
+class EnergyAccumulator:
+    """
+    Integrates power into energy as samples arrive, using the trapezoidal rule.
+
+    This gives the same result as running a Flux integral() over the day's
+    high-rate points, without having to query them back out of the database.
+
+    Accumulators are periodically checkpointed to disk so that a restart
+    does not lose the day's progress.
+
+    If gap_threshold is set, gaps longer than it (the logger was down) are
+    not interpolated across. The energy is taken from the change in the
+    series' cumulative energy counter instead, if it has one.
+    """
+    def __init__(self, checkpoint_path: str, checkpoint_interval: float = 60, gap_threshold: float = None) -> None:
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.gap_threshold = gap_threshold
+
+        self.date = date.today()
+        self.Wh = {} # type: Dict[SeriesKey, float]
+        # Most recent (timestamp, power) of each series
+        self.prev = {} # type: Dict[SeriesKey, Tuple[float, float]]
+        # Most recent cumulative energy counter reading of each series
+        self.counters = {} # type: Dict[SeriesKey, float]
+
+        self._last_checkpoint = time.monotonic()
+        self.load_checkpoint()
+
+    def add(self, key: SeriesKey, ts: datetime, P: float, counter: float = None) -> Optional[Tuple[float, float, float]]:
+        """
+        counter: The series' cumulative energy counter (Wh), if it has one
+
+        If the energy over a gap was taken from the counter, returns the gap's
+        (start timestamp, end timestamp, Wh)
+        """
+        t = ts.timestamp()
+        prev = self.prev.get(key)
+        Wh = self.Wh.get(key, 0.0)
+        gap = None
+        if prev is not None and t > prev[0]:
+            prev_t, prev_P = prev
+            gap_Wh = self._gap_Wh(key, t - prev_t, counter)
+            if gap_Wh is None:
+                Wh += (prev_P + P) / 2 * (t - prev_t) / 3600
+            else:
+                Wh += gap_Wh
+                gap = (prev_t, t, gap_Wh)
+        self.Wh[key] = Wh
+        self.prev[key] = (t, P)
+        if counter is not None:
+            self.counters[key] = counter
+        return gap
+
+    def _gap_Wh(self, key: SeriesKey, dt: float, counter: Optional[float]) -> Optional[float]:
+        if self.gap_threshold is None or dt < self.gap_threshold:
+            return None
+        prev_counter = self.counters.get(key)
+        if counter is None or prev_counter is None:
+            return None
+        Wh = counter - prev_counter
+        if Wh < 0 and key[0] != "net":
+            # Counter was reset. Can't tell how much energy was missed
+            LOG.warning("Energy counter for %s went backwards. Interpolating over gap instead", "/".join(key))
+            return None
+        return Wh
+
+    def last_timestamp(self, key: SeriesKey) -> Optional[float]:
+        """
+        Timestamp of the series' most recent sample, if any
+        """
+        prev = self.prev.get(key)
+        if prev is None:
+            return None
+        return prev[0]
+
+    def rollover(self) -> Dict[SeriesKey, float]:
+        """
+        Start a new day, and return the totals of the prior one.
+
+        The last sample of each series is kept. The interval between it and
+        the first sample of the new day counts towards the new day.
+        """
+        totals = self.Wh
+        self.Wh = {}
+        self.date = date.today()
+        self.checkpoint()
+        return totals
+
+    def maybe_checkpoint(self) -> None:
+        if time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        data = {
+            "date": self.date.isoformat(),
+            "series": [
+                [key[0], key[1], self.Wh.get(key, 0.0), *self.prev.get(key, (None, None)), self.counters.get(key)]
+                for key in set(self.Wh) | set(self.prev)
+            ],
+        }
+        os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+        self._last_checkpoint = time.monotonic()
+
+    def load_checkpoint(self) -> None:
+        if not os.path.exists(self.checkpoint_path):
+            return
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            LOG.warning("Unable to read energy checkpoint %s: %s", self.checkpoint_path, e)
+            return
+
+        if data.get("date") != self.date.isoformat():
+            # Checkpoint is from a prior day. Not useful
+            return
+
+        for kind, ident, Wh, prev_t, prev_P, *extra in data["series"]:
+            key = (kind, ident)
+            self.Wh[key] = Wh
+            if prev_t is not None:
+                self.prev[key] = (prev_t, prev_P)
+            # Older checkpoints do not have counters
+            if extra and extra[0] is not None:
+                self.counters[key] = extra[0]
+        LOG.info("Restored today's energy totals from: %s", self.checkpoint_path)
@@ -1,8 +1,10 @@
-from typing import Optional
+from typing import Optional, Callable, List
 from datetime import datetime, timedelta
+import threading
 import json
 import base64
 import os
+import time
 import logging
 
 import requests
@@ -10,7 +12,7 @@ from appdirs import user_cache_dir
 
 LOG = logging.getLogger("enphaseenergy")
 
-def _login_enphaseenergy(email: str, password: str) -> str:
+def _login_enphaseenergy(session: requests.Session, email: str, password: str) -> str:
     LOG.info("Logging into enphaseenergy.com as %s", email)
     # Login and get session ID
     files = {
@@ -18,7 +20,7 @@ def _login_enphaseenergy(email: str, password: str) -> str:
         'user[password]': (None, password),
     }
     url = 'https://enlighten.enphaseenergy.com/login/login.json?'
-    response = requests.post(
+    response = session.post(
         url,
         files=files,
         timeout=30,
@@ -31,22 +33,23 @@ def get_new_token(email: str, password: str, envoy_serial: str) -> str:
     """
     Login to enphaseenergy.com and return an access token for the envoy.
     """
-    session_id = _login_enphaseenergy(email, password)
-
-    LOG.info("Downloading new access token for envoy S/N: %s", envoy_serial)
-    # Get the token
-    json_data = {
-        'session_id': session_id,
-        'serial_num': envoy_serial,
-        'username': email,
-    }
-    response = requests.post(
-        'https://entrez.enphaseenergy.com/tokens',
-        json=json_data,
-        timeout=30,
-    )
-    response.raise_for_status() # raise HTTPError if one occurred
-    return response.text
+    with requests.Session() as session:
+        session_id = _login_enphaseenergy(session, email, password)
+
+        LOG.info("Downloading new access token for envoy S/N: %s", envoy_serial)
+        # Get the token
+        json_data = {
+            'session_id': session_id,
+            'serial_num': envoy_serial,
+            'username': email,
+        }
+        response = session.post(
+            'https://entrez.enphaseenergy.com/tokens',
+            json=json_data,
+            timeout=30,
+        )
+        response.raise_for_status() # raise HTTPError if one occurred
+        return response.text
 
 def token_expiration_date(token: str) -> datetime:
     jwt = {}
@@ -101,3 +104,112 @@ def get_token(email: str, password: str, envoy_serial: str) -> str:
         save_token_to_cache(envoy_serial, token)
 
     return token
+
+
+class TokenManager:
+    """
+    Keeps an envoy's access token fresh.
+
+    The token and its expiration date are held in memory. Once started, a
+    background thread downloads a new token ahead of the expiration, and hands
+    it to listeners so that they can log into the envoy again without
+    interrupting sampling.
+    """
+    def __init__(self, email: str, password: str, envoy_serial: str, token: str = None,
+                 refresh_margin: timedelta = timedelta(days=1), retry_interval: float = 300) -> None:
+        self.email = email
+        self.password = password
+        self.envoy_serial = envoy_serial
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+
+        self._listeners = [] # type: List[Callable[[str], None]]
+        self._lock = threading.Lock()
+        self._thread = None # type: Optional[threading.Thread]
+
+        if token is None:
+            token = get_token(email, password, envoy_serial)
+        self._set_token(token)
+
+    def _set_token(self, token: str) -> None:
+        with self._lock:
+            self._token = token
+            self._acquired = datetime.now()
+            self._expiration = None # type: Optional[datetime]
+
+    @property
+    def token(self) -> str:
+        return self._token
+
+    @property
+    def expiration(self) -> datetime:
+        # Only decoded once per token
+        if self._expiration is None:
+            self._expiration = token_expiration_date(self._token)
+        return self._expiration
+
+    @property
+    def refresh_date(self) -> datetime:
+        """
+        When the token will be replaced.
+
+        Normally this is refresh_margin ahead of the expiration, but
+        short-lived tokens are replaced halfway through their remaining life
+        so that they are not refreshed continuously.
+        """
+        return max(
+            self.expiration - self.refresh_margin,
+            self._acquired + (self.expiration - self._acquired) / 2,
+        )
+
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        """
+        Call listener(token) whenever the token is replaced
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str], None]) -> None:
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"token-{self.envoy_serial}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            # Sleep in bounded steps so that a change to the system clock is
+            # not overslept
+            delay = (self.refresh_date - datetime.now()).total_seconds()
+            if delay > 0:
+                time.sleep(min(delay, 3600))
+                continue
+
+            LOG.info("Token for envoy S/N %s expires %s. Getting a new one", self.envoy_serial, self.expiration)
+            try:
+                token = get_new_token(self.email, self.password, self.envoy_serial)
+                token_expiration_date(token)
+            except (requests.RequestException, ValueError, KeyError) as e:
+                LOG.error("Failed to refresh token for envoy S/N %s: %s", self.envoy_serial, e)
+                time.sleep(self.retry_interval)
+                continue
+            save_token_to_cache(self.envoy_serial, token)
+            self._set_token(token)
+
+            with self._lock:
+                listeners = list(self._listeners)
+            for listener in listeners:
+                try:
+                    listener(token)
+                except Exception as e:
+                    # The old session keeps working until it expires. If it
+                    # does, the sampler logs in again itself.
+                    LOG.error("Failed to apply new token for envoy S/N %s: %s", self.envoy_serial, e)
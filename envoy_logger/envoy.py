@@ -1,82 +1,136 @@
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timezone
 import logging
-from typing import Dict
+from typing import Dict, List
 
 from . import model
+from .metrics import ENVOY_REQUEST_SECONDS, PARSE_SECONDS
 
 # Local envoy access uses self-signed certificate. Ignore the warning
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 LOG = logging.getLogger("envoy")
 
-def login(url: str, token: str) -> str:
+class EnvoyClient:
     """
-    Login to local envoy and return the session id
+    Connection to a local envoy.
+
+    All requests go through a persistent session so that the connection (and
+    its TLS handshake) is reused between samples rather than re-established
+    on every request.
     """
-    headers = {
-        'Authorization': f'Bearer {token}',
-    }
-    response = requests.get(
-        f'{url}/auth/check_jwt',
-        headers=headers,
-        verify=False,
-        timeout=30,
-    )
-    response.raise_for_status() # raise HTTPError if one occurred
-    session_id = response.cookies['sessionId']
-    LOG.info("Logged into envoy. SessionID: %s", session_id)
-    return session_id
-
-
-def get_power_data(url: str, session_id: str) -> model.SampleData:
-    LOG.debug("Fetching power data")
-    ts = datetime.now(timezone.utc)
-    cookies = {
-        'sessionId': session_id,
-    }
-    response = requests.get(
-        f'{url}/production.json?details=1',
-        cookies=cookies,
-        verify=False,
-        timeout=30,
-    )
-    response.raise_for_status() # raise HTTPError if one occurred
-    json_data = response.json()
-    data = model.SampleData(json_data, ts)
-    return data
-
-
-def get_inverter_data(url: str, session_id: str) -> Dict[str, model.InverterSample]:
-    LOG.debug("Fetching inverter data")
-    ts = datetime.now(timezone.utc)
-    cookies = {
-        'sessionId': session_id,
-    }
-    response = requests.get(
-        f'{url}/api/v1/production/inverters',
-        cookies=cookies,
-        verify=False,
-        timeout=30,
-    )
-    response.raise_for_status() # raise HTTPError if one occurred
-    json_data = response.json()
-    data = model.parse_inverter_data(json_data, ts)
-    return data
-
-
-def get_inventory(url: str, session_id: str):
-    cookies = {
-        'sessionId': session_id,
-    }
-    response = requests.get(
-        f'{url}/inventory.json?deleted=1',
-        cookies=cookies,
-        verify=False,
-        timeout=30,
-    )
-    response.raise_for_status() # raise HTTPError if one occurred
-    json_data = response.json()
-    # TODO: Convert to objects
-    return json_data
+    def __init__(self, url: str, pool_size: int = 4, retries: int = 2, name: str = None) -> None:
+        self.url = url
+        # Used to label metrics
+        self.name = name or url
+
+        self.session = requests.Session()
+        self.session.verify = False
+
+        # Only retry failures that happen before the envoy got the request, or
+        # that it explicitly reports. A read timeout is left to the caller.
+        retry = Retry(
+            total=retries,
+            read=0,
+            backoff_factor=0.5,
+            status_forcelist=(500, 502, 503, 504),
+            raise_on_status=False,
+        )
+        self.adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+        )
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+    @property
+    def connection_count(self) -> int:
+        """
+        Number of connections opened to the envoy so far.
+        Each of these costs a new TCP and TLS handshake.
+        """
+        pools = self.adapter.poolmanager.pools
+        count = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                count += pool.num_connections
+        return count
+
+    def _get(self, endpoint: str, path: str) -> requests.Response:
+        with ENVOY_REQUEST_SECONDS.labels(envoy=self.name, endpoint=endpoint).time():
+            response = self.session.get(
+                f'{self.url}{path}',
+                timeout=30,
+            )
+        response.raise_for_status() # raise HTTPError if one occurred
+        return response
+
+    def login(self, token: str) -> str:
+        """
+        Login to local envoy and return the session id.
+
+        This can be called again with a new token while other threads are
+        making requests.
+        """
+        headers = {
+            'Authorization': f'Bearer {token}',
+        }
+        # Authenticate on a separate session, so that the new session cookie
+        # replaces the old one in one step rather than clearing it out from
+        # under requests that are in flight.
+        with requests.Session() as session:
+            session.verify = False
+            response = session.get(
+                f'{self.url}/auth/check_jwt',
+                headers=headers,
+                timeout=30,
+            )
+        response.raise_for_status() # raise HTTPError if one occurred
+        session_id = response.cookies['sessionId']
+
+        # Hold onto the session cookie for all subsequent requests
+        self.session.cookies.set('sessionId', session_id)
+
+        LOG.info("Logged into envoy. SessionID: %s", session_id)
+        return session_id
+
+    def get_power_data(self, ts: datetime = None) -> model.SampleData:
+        """
+        ts: Timestamp to give the sample. Defaults to now
+        """
+        LOG.debug("Fetching power data")
+        ts = ts or datetime.now(timezone.utc)
+        response = self._get("production", '/production.json?details=1')
+        with PARSE_SECONDS.labels(envoy=self.name, endpoint="production").time():
+            data = model.parse_power_data(response.content, ts)
+        return data
+
+    def get_inverter_data(self, ts: datetime = None) -> Dict[str, model.InverterSample]:
+        """
+        ts: Timestamp to give the samples. Defaults to now
+        """
+        ts = ts or datetime.now(timezone.utc)
+        return model.parse_inverter_data(self.get_inverter_reports(), ts)
+
+    def get_inverter_reports(self) -> List[dict]:
+        """
+        Get the unparsed list of inverter reports
+        """
+        LOG.debug("Fetching inverter data")
+        response = self._get("inverters", '/api/v1/production/inverters')
+        with PARSE_SECONDS.labels(envoy=self.name, endpoint="inverters").time():
+            json_data = model.loads(response.content)
+        return json_data
+
+    def get_inventory(self) -> Dict[str, model.InventoryDevice]:
+        LOG.debug("Fetching inventory")
+        response = self._get("inventory", '/inventory.json?deleted=1')
+        with PARSE_SECONDS.labels(envoy=self.name, endpoint="inventory").time():
+            json_data = model.loads(response.content)
+            data = model.parse_inventory(json_data)
+        return data
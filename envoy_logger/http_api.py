@@ -0,0 +1,93 @@
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from typing import Callable, Dict, Iterator, List, Tuple
+import socketserver
+import threading
+import logging
+
+LOG = logging.getLogger("http_api")
+
+# Route handlers get the parsed query string, and return (content type, body)
+RouteHandler = Callable[[Dict[str, List[str]]], Tuple[str, bytes]]
+
+# Stream handlers get the parsed query string, and return an iterator of
+# server-sent events. Raising ValueError before the first event rejects the
+# request.
+StreamHandler = Callable[[Dict[str, List[str]]], Iterator[bytes]]
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    # Same as http.server.ThreadingHTTPServer, which needs Python 3.7
+    daemon_threads = True
+
+class HttpApi:
+    """
+    Small local HTTP server for status endpoints
+    """
+    def __init__(self, bind: str, port: int) -> None:
+        self.routes = {} # type: Dict[str, RouteHandler]
+        self.stream_routes = {} # type: Dict[str, StreamHandler]
+
+        api = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path in api.stream_routes:
+                    self.do_stream(api.stream_routes[url.path], parse_qs(url.query))
+                    return
+                route = api.routes.get(url.path)
+                if route is None:
+                    self.send_error(404)
+                    return
+                try:
+                    content_type, body = route(parse_qs(url.query))
+                except ValueError as e:
+                    self.send_error(400, str(e))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_stream(self, handler: StreamHandler, query: Dict[str, List[str]]):
+                events = handler(query)
+                try:
+                    event = next(events)
+                except ValueError as e:
+                    self.send_error(400, str(e))
+                    return
+                # No length, so the end of the stream is the end of the connection
+                self.close_connection = True
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                try:
+                    while True:
+                        self.wfile.write(event)
+                        self.wfile.flush()
+                        event = next(events)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client went away
+                    pass
+                finally:
+                    events.close()
+
+        self.server = _Server((bind, port), Handler)
+        self._thread = threading.Thread(target=self.server.serve_forever, name="http-api", daemon=True)
+
+    def add_route(self, path: str, handler: RouteHandler) -> None:
+        self.routes[path] = handler
+
+    def add_stream_route(self, path: str, handler: StreamHandler) -> None:
+        self.stream_routes[path] = handler
+
+    def start(self) -> None:
+        host, port = self.server.server_address[:2]
+        LOG.info("Serving local HTTP API on http://%s:%d", host, port)
+        self._thread.start()
@@ -0,0 +1,88 @@
+from typing import Any, Callable, Dict, List, Set, Tuple
+import logging
+
+from .model import InventoryDevice
+
+LOG = logging.getLogger("inventory")
+
+TagSet = Tuple[Tuple[str, Any], ...]
+
+# Inventory metadata that can be added to inverter points as tags
+INVENTORY_TAGS = {
+    "part-num": lambda device: device.part_num,
+    "device-type": lambda device: device.device_type,
+    "status": lambda device: ",".join(device.status),
+} # type: Dict[str, Callable[[InventoryDevice], Any]]
+
+class InventoryIndex:
+    """
+    The envoy's device inventory keyed by serial number, merged with the
+    inverter tags from the config.
+
+    Each inverter's tag set is computed once, and reused for every point
+    until the inventory changes. version is bumped whenever that happens so
+    that anything caching tag sets knows to rebuild them.
+    """
+    def __init__(self, envoy_cfg: 'EnvoyConfig', tag_names: List[str] = None) -> None:
+        self.envoy_cfg = envoy_cfg
+        self.tag_names = list(tag_names or [])
+        for name in self.tag_names:
+            if name not in INVENTORY_TAGS:
+                raise ValueError(f"Unknown inventory tag: {name}")
+
+        self.devices = {} # type: Dict[str, InventoryDevice]
+        self.version = 0
+        self._inverter_tags = {} # type: Dict[str, TagSet]
+
+    def update(self, devices: Dict[str, InventoryDevice]) -> None:
+        old_devices = self.devices
+        self.devices = devices
+
+        # Only invalidate tags if something that affects them changed
+        changed = set(devices) != set(old_devices)
+        if not changed and self.tag_names:
+            changed = any(
+                self._inventory_tags(device) != self._inventory_tags(old_devices[serial])
+                for serial, device in devices.items()
+            )
+        if changed:
+            LOG.info("Envoy %s inventory: %d devices", self.envoy_cfg.source_tag, len(devices))
+            self._inverter_tags = {}
+            self.version += 1
+
+    def _inventory_tags(self, device: InventoryDevice) -> TagSet:
+        tags = []
+        for name in self.tag_names:
+            value = INVENTORY_TAGS[name](device)
+            if value is not None and value != "":
+                tags.append((name, value))
+        return tuple(tags)
+
+    def inverter_tags(self, serial: str) -> TagSet:
+        """
+        Tags to apply to an inverter's points: inventory metadata, then
+        configured tags, which take precedence
+        """
+        tags = self._inverter_tags.get(serial)
+        if tags is None:
+            merged = {}
+            device = self.devices.get(serial)
+            if device is not None:
+                merged.update(self._inventory_tags(device))
+            inverter_cfg = self.envoy_cfg.inverters.get(serial)
+            if inverter_cfg is not None:
+                merged.update(inverter_cfg.tags)
+            tags = tuple(merged.items())
+            self._inverter_tags[serial] = tags
+        return tags
+
+    @property
+    def inverter_serials(self) -> Set[str]:
+        """
+        All known inverters: configured ones, plus any in the inventory
+        """
+        serials = set(self.envoy_cfg.inverters.keys())
+        for serial, device in self.devices.items():
+            if device.device_type == "PCU":
+                serials.add(serial)
+        return serials
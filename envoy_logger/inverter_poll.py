@@ -0,0 +1,114 @@
+from typing import Dict, Optional
+import time
+import logging
+
+from .model import InverterSample
+from . import metrics
+
+LOG = logging.getLogger("inverter_poll")
+
+class _InverterCadence:
+    __slots__ = ("report_ts", "reported", "interval", "learned")
+
+    def __init__(self, report_ts: int, reported: float, interval: float) -> None:
+        # Envoy's timestamp of the last report
+        self.report_ts = report_ts
+        # Estimated local (monotonic) time of the last report
+        self.reported = reported
+        # Estimated time between reports
+        self.interval = interval
+        self.learned = False
+
+
+class InverterPollSchedule:
+    """
+    Decides when the inverter endpoint is worth requesting.
+
+    Inverters only report every few minutes. The time between each inverter's
+    reports is learned from its lastReportDate, and the endpoint is only
+    requested once a new report is expected from at least one of them, and
+    no more often than min_interval.
+
+    Inverters that are well overdue (eg: at night) stop being waited on, and
+    are only picked up by the safety poll, which runs at least every
+    safety_interval regardless.
+
+    All times are monotonic.
+    """
+    # Until an inverter has reported twice, assume this
+    DEFAULT_REPORT_INTERVAL = 300
+    # Estimates are smoothed. Gaps longer than this many times the estimate
+    # were missed reports, and are not counted
+    SMOOTHING = 0.25
+    MAX_INTERVAL_RATIO = 2
+    # Inverters are considered stale once this many reports overdue
+    STALE_RATIO = 2
+
+    def __init__(self, min_interval: float = 30, safety_interval: float = 900, name: str = "") -> None:
+        self.min_interval = min_interval
+        self.safety_interval = safety_interval
+        self.name = name
+
+        self.inverters = {} # type: Dict[str, _InverterCadence]
+        self.last_poll = None # type: Optional[float]
+        # Earliest time a new report is expected from any inverter
+        self.next_expected = None # type: Optional[float]
+
+    def due(self, now: float) -> bool:
+        if self.last_poll is None:
+            return True
+        since = now - self.last_poll
+        if since >= self.safety_interval:
+            return True
+        if since < self.min_interval:
+            return False
+        return self.next_expected is not None and now >= self.next_expected
+
+    def polled(self, now: float) -> None:
+        self.last_poll = now
+
+    def observe(self, new_data: Dict[str, InverterSample], now: float) -> None:
+        """
+        Record the inverters that have a new report, first seen at now.
+        Called after every poll, even if nothing new was reported.
+        """
+        # Envoy's clock can't be trusted to match ours, but its report
+        # timestamps are consistent with each other. Assume the newest report
+        # was just made, and place the others relative to it.
+        newest = max((inverter.report_ts for inverter in new_data.values()), default=0)
+        for serial, inverter in new_data.items():
+            reported = now - (newest - inverter.report_ts)
+            cadence = self.inverters.get(serial)
+            if cadence is None:
+                self.inverters[serial] = _InverterCadence(inverter.report_ts, reported, self.DEFAULT_REPORT_INTERVAL)
+                self._add_metrics(serial)
+                continue
+            interval = inverter.report_ts - cadence.report_ts
+            if interval > 0:
+                if not cadence.learned:
+                    cadence.interval = interval
+                    cadence.learned = True
+                elif interval <= cadence.interval * self.MAX_INTERVAL_RATIO:
+                    cadence.interval += (interval - cadence.interval) * self.SMOOTHING
+            cadence.report_ts = inverter.report_ts
+            cadence.reported = reported
+        self._update_next_expected(now)
+
+    def _update_next_expected(self, now: float) -> None:
+        next_expected = None
+        for cadence in self.inverters.values():
+            expected = cadence.reported + cadence.interval
+            if now - expected > cadence.interval * self.STALE_RATIO:
+                continue
+            if next_expected is None or expected < next_expected:
+                next_expected = expected
+        self.next_expected = next_expected
+
+    def _add_metrics(self, serial: str) -> None:
+        cadence = self.inverters[serial]
+        metrics.INVERTER_REPORT_INTERVAL_SECONDS.labels(envoy=self.name, serial=serial).set_function(
+            lambda: cadence.interval
+        )
+        metrics.INVERTER_STALENESS_SECONDS.labels(envoy=self.name, serial=serial).set_function(
+            lambda: time.monotonic() - cadence.reported
+        )
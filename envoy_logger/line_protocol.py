@@ -0,0 +1,324 @@
+"""
+Direct InfluxDB line-protocol encoding.
+
+Building an influxdb_client Point for every line and inverter on every tick
+is surprisingly expensive. Measurement names and tag sets never change for a
+given line or inverter, so they are escaped once and cached. Each tick only
+needs to format the field values and timestamp.
+
+Output is byte-identical to Point.to_line_protocol() with WritePrecision.MS
+Millisecond precision is used throughout so that sub-second sampling
+intervals are possible.
+"""
+from datetime import datetime, timezone
+from typing import Dict, Tuple, Any, Optional, List
+import math
+
+from .model import PowerSample, InverterSample, SampleData
+from .derived import phase_angle, compute_totals
+from .cfg import EnvoyConfig
+from .inventory import InventoryIndex
+
+EPOCH = datetime.fromtimestamp(0, tz=timezone.utc)
+
+def to_line_protocol(record: Any) -> str:
+    """
+    Records can either be line-protocol strings, or influxdb_client Points
+    """
+    if isinstance(record, str):
+        return record
+    # influxdb_client is slow to import, so only import it once a Point
+    # actually shows up
+    from influxdb_client import WritePrecision
+    return record.to_line_protocol(WritePrecision.MS)
+
+# Same escaping rules as influxdb_client
+_ESCAPE_MEASUREMENT = str.maketrans({
+    ',': r'\,',
+    ' ': r'\ ',
+    '\n': r'\n',
+    '\t': r'\t',
+    '\r': r'\r',
+})
+
+_ESCAPE_KEY = str.maketrans({
+    ',': r'\,',
+    '=': r'\=',
+    ' ': r'\ ',
+    '\n': r'\n',
+    '\t': r'\t',
+    '\r': r'\r',
+})
+
+_ESCAPE_STRING = str.maketrans({
+    '"': r'\"',
+    '\\': r'\\',
+})
+
+
+def escape_measurement(name: str) -> str:
+    return str(name).translate(_ESCAPE_MEASUREMENT)
+
+
+def escape_key(key: Any) -> str:
+    return str(key).translate(_ESCAPE_KEY)
+
+
+def escape_tag_value(value: Any) -> str:
+    s = escape_key(value)
+    if s.endswith('\\'):
+        s += ' '
+    return s
+
+
+def encode_prefix(measurement: str, tags: Dict[str, Any]) -> str:
+    """
+    Encode the measurement name and tag set.
+    Includes the trailing space that separates it from the field set.
+    """
+    parts = [escape_measurement(measurement)]
+    for k, v in sorted(tags.items()):
+        if v is None:
+            continue
+        k = escape_key(k)
+        v = escape_tag_value(v)
+        if k and v:
+            parts.append(f"{k}={v}")
+    return ",".join(parts) + " "
+
+
+def encode_field_value(value: Any) -> str:
+    """
+    Encode a field value.
+    Returns None if the value is to be omitted
+    """
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return None
+        s = str(value)
+        if s.endswith('.0'):
+            s = s[:-2]
+        return s
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, int):
+        return f"{value}i"
+    if isinstance(value, str):
+        return '"' + value.translate(_ESCAPE_STRING) + '"'
+    raise ValueError(f'Type: "{type(value)}" of field value is not supported.')
+
+
+def encode_timestamp(ts: datetime) -> int:
+    """
+    Timestamp in milliseconds since epoch
+    """
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    delta = ts - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000 + delta.microseconds // 1000
+
+
+def encode_line(prefix: str, fields: Tuple[Tuple[str, Any], ...], ts: datetime) -> str:
+    """
+    Encode a complete line.
+    fields shall be pre-escaped (key, value) pairs, sorted by key.
+    """
+    field_strs = []
+    for k, v in fields:
+        v = encode_field_value(v)
+        if v is not None:
+            field_strs.append(f"{k}={v}")
+    if not field_strs:
+        return ""
+    return f"{prefix}{','.join(field_strs)} {encode_timestamp(ts)}"
+
+
+class LineEncoder:
+    """
+    Encodes high-rate samples into line protocol, caching the measurement
+    and tag set of each line and inverter.
+
+    extra_tags are added to every line.
+    If an inventory index is given, inverter tags come from it. Otherwise
+    they come from the config.
+    If derived is set, lines also get power factor and phase angle fields.
+    """
+    def __init__(self, envoy_cfg: EnvoyConfig, extra_tags: Dict[str, Any] = None,
+                 inventory: InventoryIndex = None, derived: bool = False) -> None:
+        self.envoy_cfg = envoy_cfg
+        self.extra_tags = extra_tags or {}
+        self.inventory = inventory
+        self.derived = derived
+        self._line_prefixes = {} # type: Dict[Tuple[str, int], str]
+        self._total_prefixes = {} # type: Dict[str, str]
+        self._inverter_prefixes = {} # type: Dict[str, str]
+        self._inventory_version = None # type: Optional[int]
+
+    def line_prefix(self, measurement_type: str, idx: int) -> str:
+        key = (measurement_type, idx)
+        prefix = self._line_prefixes.get(key)
+        if prefix is None:
+            tags = {
+                "source": self.envoy_cfg.source_tag,
+                "measurement-type": measurement_type,
+                "line-idx": idx,
+            }
+            tags.update(self.extra_tags)
+            prefix = encode_prefix(f"{measurement_type}-line{idx}", tags)
+            self._line_prefixes[key] = prefix
+        return prefix
+
+    def inverter_prefix(self, serial: str) -> str:
+        if self.inventory is not None and self.inventory.version != self._inventory_version:
+            # Inventory changed. Tags may be different now
+            self._inverter_prefixes.clear()
+            self._inventory_version = self.inventory.version
+
+        prefix = self._inverter_prefixes.get(serial)
+        if prefix is None:
+            tags = {
+                "source": self.envoy_cfg.source_tag,
+                "measurement-type": "inverter",
+                "serial": serial,
+            }
+            if self.inventory is not None:
+                tags.update(self.inventory.inverter_tags(serial))
+            else:
+                inverter_cfg = self.envoy_cfg.inverters.get(serial)
+                if inverter_cfg is not None:
+                    tags.update(inverter_cfg.tags)
+            tags.update(self.extra_tags)
+            prefix = encode_prefix(f"inverter-production-{serial}", tags)
+            self._inverter_prefixes[serial] = prefix
+        return prefix
+
+    def total_prefix(self, measurement_type: str) -> str:
+        prefix = self._total_prefixes.get(measurement_type)
+        if prefix is None:
+            tags = {
+                "source": self.envoy_cfg.source_tag,
+                "measurement-type": f"{measurement_type}-total",
+            }
+            tags.update(self.extra_tags)
+            prefix = encode_prefix(f"{measurement_type}-total", tags)
+            self._total_prefixes[measurement_type] = prefix
+        return prefix
+
+    def line_fields(self, data: PowerSample) -> Tuple[Tuple[str, Any], ...]:
+        # Sorted by key
+        if self.derived:
+            return (
+                ("I_rms", data.rmsCurrent),
+                ("P", data.wNow),
+                ("PF", data.pwrFactor),
+                ("Q", data.reactPwr),
+                ("S", data.apprntPwr),
+                ("V_rms", data.rmsVoltage),
+                ("phase_angle", phase_angle(data.wNow, data.reactPwr)),
+            )
+        return (
+            ("I_rms", data.rmsCurrent),
+            ("P", data.wNow),
+            ("Q", data.reactPwr),
+            ("S", data.apprntPwr),
+            ("V_rms", data.rmsVoltage),
+        )
+
+    @staticmethod
+    def inverter_fields(inverter: InverterSample) -> Tuple[Tuple[str, Any], ...]:
+        return (
+            ("P", inverter.watts),
+        )
+
+    def encode_line_sample(self, measurement_type: str, idx: int, data: PowerSample) -> str:
+        fields = self.line_fields(data)
+        return encode_line(self.line_prefix(measurement_type, idx), fields, data.ts)
+
+    def encode_totals(self, data: SampleData) -> List[str]:
+        """
+        Encode the all-lines total of each measurement type
+        """
+        lines = []
+        for measurement_type, fields in compute_totals(data).items():
+            fields = tuple(sorted(fields.items()))
+            lines.append(encode_line(self.total_prefix(measurement_type), fields, data.ts))
+        return lines
+
+    def encode_inverter_sample(self, inverter: InverterSample) -> str:
+        fields = self.inverter_fields(inverter)
+        return encode_line(self.inverter_prefix(inverter.serial), fields, inverter.ts)
+
+
+#-------------------------------------------------------------------------------
+_UNESCAPE = {
+    'n': '\n',
+    't': '\t',
+    'r': '\r',
+    ',': ',',
+    '=': '=',
+    ' ': ' ',
+    '"': '"',
+    '\\': '\\',
+}
+
+def _scan(line: str, i: int, stops: str) -> Tuple[str, int]:
+    """
+    Read up to the next unescaped character in stops
+    """
+    out = []
+    n = len(line)
+    while i < n:
+        c = line[i]
+        if c == '\\' and i + 1 < n and line[i + 1] in _UNESCAPE:
+            out.append(_UNESCAPE[line[i + 1]])
+            i += 2
+            continue
+        if c in stops:
+            break
+        out.append(c)
+        i += 1
+    return "".join(out), i
+
+
+def _decode_field_value(raw: str) -> Any:
+    if raw in ("true", "false"):
+        return raw == "true"
+    if raw.endswith("i"):
+        return int(raw[:-1])
+    return float(raw)
+
+
+def parse_line(line: str) -> Tuple[str, Dict[str, str], Dict[str, Any], Optional[int]]:
+    """
+    Split a line back up into its measurement, tags, fields and timestamp.
+    Inverse of encode_line()
+    """
+    n = len(line)
+    measurement, i = _scan(line, 0, ", ")
+
+    tags = {}
+    while i < n and line[i] == ",":
+        k, i = _scan(line, i + 1, "=")
+        v, i = _scan(line, i + 1, ", ")
+        tags[k] = v
+
+    fields = {} # type: Dict[str, Any]
+    while i < n and line[i] in ", ":
+        k, i = _scan(line, i + 1, "=")
+        i += 1
+        if i < n and line[i] == '"':
+            v, i = _scan(line, i + 1, '"')
+            fields[k] = v
+            i += 1
+        else:
+            raw, i = _scan(line, i, ", ")
+            fields[k] = _decode_field_value(raw)
+        if i >= n or line[i] == " ":
+            break
+
+    ts = None
+    if i < n and line[i] == " ":
+        ts = int(line[i + 1:])
+    return measurement, tags, fields, ts
@@ -0,0 +1,282 @@
+"""
+Lightweight self-instrumentation.
+
+Metrics are exposed in the Prometheus text format, and can optionally be
+written to InfluxDB as "envoy-logger-*" measurements.
+"""
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple, Iterator, Optional
+import bisect
+import threading
+import time
+import logging
+
+from .line_protocol import encode_prefix, encode_line
+
+LOG = logging.getLogger("metrics")
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class _Value:
+    __slots__ = ("value", "function", "lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self.function = None # type: Optional[Callable[[], float]]
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """
+        Read the value from a function whenever it is collected
+        """
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            return self.function()
+        return self.value
+
+
+class _HistogramValue:
+    __slots__ = ("upper_bounds", "counts", "sum", "lock")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]) -> None:
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.upper_bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help_text = help_text
+        self._children = {} # type: Dict[LabelKey, object]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def labels(self, **labels: str):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        return _Value()
+
+    def children(self) -> List[Tuple[LabelKey, object]]:
+        with self._lock:
+            return list(self._children.items())
+
+    def influxdb_measurement(self) -> str:
+        return self.name.replace("_", "-")
+
+
+class Counter(Metric):
+    kind = "counter"
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...]) -> None:
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+
+#-------------------------------------------------------------------------------
+REGISTRY = [] # type: List[Metric]
+
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+ENVOY_REQUEST_SECONDS = Histogram(
+    "envoy_logger_envoy_request_seconds",
+    "Envoy HTTP request latency",
+    _LATENCY_BUCKETS,
+)
+PARSE_SECONDS = Histogram(
+    "envoy_logger_parse_seconds",
+    "Time spent decoding and parsing Envoy responses",
+    _LATENCY_BUCKETS,
+)
+POINT_BUILD_SECONDS = Histogram(
+    "envoy_logger_point_build_seconds",
+    "Time spent building high-rate points",
+    _LATENCY_BUCKETS,
+)
+INFLUXDB_WRITE_SECONDS = Histogram(
+    "envoy_logger_influxdb_write_seconds",
+    "InfluxDB write latency",
+    _LATENCY_BUCKETS,
+)
+TICK_JITTER_SECONDS = Histogram(
+    "envoy_logger_tick_jitter_seconds",
+    "How late a sample was taken relative to its aligned tick",
+    _LATENCY_BUCKETS,
+)
+TICK_OVERRUNS = Counter(
+    "envoy_logger_tick_overruns_total",
+    "Times sampling fell behind by at least one whole interval",
+)
+SKIPPED_TICKS = Counter(
+    "envoy_logger_skipped_ticks_total",
+    "Sampling ticks that were missed because the previous tick overran",
+)
+SAMPLING_INTERVAL_SECONDS = Gauge(
+    "envoy_logger_sampling_interval_seconds",
+    "Current time between samples",
+)
+ENVOY_TIMEOUTS = Counter(
+    "envoy_logger_envoy_timeouts_total",
+    "Envoy requests that timed out",
+)
+FILTERED_INVERTER_SAMPLES = Counter(
+    "envoy_logger_filtered_inverter_samples_total",
+    "Inverter samples discarded because they were not a new report",
+)
+INVERTER_FETCH_ERRORS = Counter(
+    "envoy_logger_inverter_fetch_errors_total",
+    "Inverter data requests that failed or timed out",
+)
+INVERTER_POLLS = Counter(
+    "envoy_logger_inverter_polls_total",
+    "Requests made to the envoy's inverter endpoint",
+)
+INVERTER_REPORT_INTERVAL_SECONDS = Gauge(
+    "envoy_logger_inverter_report_interval_seconds",
+    "Estimated time between an inverter's reports",
+)
+INVERTER_STALENESS_SECONDS = Gauge(
+    "envoy_logger_inverter_staleness_seconds",
+    "Time since an inverter's last report",
+)
+ENVOY_CONNECTIONS = Counter(
+    "envoy_logger_envoy_connections_total",
+    "Connections opened to the envoy",
+)
+WRITE_QUEUE_DEPTH = Gauge(
+    "envoy_logger_write_queue_depth",
+    "Points waiting in an output's write queue",
+)
+WRITE_QUEUE_DROPPED = Counter(
+    "envoy_logger_write_queue_dropped_total",
+    "Points dropped because an output's write queue was full",
+)
+SPOOL_BYTES = Gauge(
+    "envoy_logger_spool_bytes",
+    "Size of the on-disk spool",
+)
+
+
+#-------------------------------------------------------------------------------
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    labels = key + extra
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels:
+        v = v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+def expose() -> str:
+    """
+    Render all metrics in the Prometheus text exposition format
+    """
+    out = []
+    for metric in REGISTRY:
+        out.append(f"# HELP {metric.name} {metric.help_text}")
+        out.append(f"# TYPE {metric.name} {metric.kind}")
+        for key, child in metric.children():
+            if isinstance(child, _HistogramValue):
+                cumulative = 0
+                bounds = child.upper_bounds + (float("inf"),)
+                for bound, count in zip(bounds, child.counts):
+                    cumulative += count
+                    labels = _format_labels(key, (("le", _format_value(bound)),))
+                    out.append(f"{metric.name}_bucket{labels} {cumulative}")
+                out.append(f"{metric.name}_sum{_format_labels(key)} {_format_value(child.sum)}")
+                out.append(f"{metric.name}_count{_format_labels(key)} {cumulative}")
+            else:
+                out.append(f"{metric.name}{_format_labels(key)} {_format_value(child.get())}")
+    out.append("")
+    return "\n".join(out)
+
+def influxdb_points(ts: datetime, extra_tags: Dict[str, str] = None) -> List[str]:
+    """
+    Render all metrics as line protocol
+    """
+    points = []
+    for metric in REGISTRY:
+        measurement = metric.influxdb_measurement()
+        for key, child in metric.children():
+            tags = dict(key)
+            tags.update(extra_tags or {})
+            if isinstance(child, _HistogramValue):
+                fields = (("count", child.count), ("sum", child.sum))
+            else:
+                fields = (("value", float(child.get())),)
+            points.append(encode_line(encode_prefix(measurement, tags), fields, ts))
+    return points
+
+
+class InfluxDBExporter:
+    """
+    Periodically hands a snapshot of all metrics to the writer
+    """
+    def __init__(self, writer, bucket: str, interval: float = 60) -> None:
+        self.writer = writer
+        self.bucket = bucket
+        self.interval = interval
+        self._thread = threading.Thread(target=self._run, name="metrics-export", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.writer.put(self.bucket, influxdb_points(datetime.now(timezone.utc)))
+            except Exception as e:
+                LOG.error("Failed to export metrics: %s", e)
@@ -1,12 +1,35 @@
 from datetime import datetime
-from typing import Optional, Dict
+from typing import Optional, Dict, Iterator, Tuple, List, Any
+import json
 import logging
+
+# orjson is much faster than the standard library, but is optional
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# numpy is used to filter large inverter arrays, but is optional
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 LOG = logging.getLogger("envoy")
 
 class PowerSample:
     """
     A generic power sample
     """
+    # Samples are kept around in memory, so keep them compact
+    __slots__ = (
+        "ts",
+        "wNow", "rmsCurrent", "rmsVoltage", "reactPwr", "apprntPwr",
+        "whToday", "vahToday", "varhLagToday", "varhLeadToday",
+        "whLifetime", "vahLifetime", "varhLagLifetime", "varhLeadLifetime",
+        "whLastSevenDays",
+    )
+
     def __init__(self, data, ts: datetime) -> None:
         self.ts = ts
 
@@ -48,6 +71,8 @@ class EIMSample:
     Envoy firmware has a bug where it miscalculates apparent power.
     Better to recalculate the values locally
     """
+    __slots__ = ("ts", "lines")
+
     def __init__(self, data, ts: datetime) -> None:
         assert data['type'] == "eim"
 
@@ -65,12 +90,16 @@ class EIMLineSample(PowerSample):
     """
     Sample for a Single "EIM" line sensor
     """
+    __slots__ = ("parent",)
+
     def __init__(self, parent: EIMSample, data) -> None:
         self.parent = parent
         super().__init__(data, parent.ts)
 
 
 class SampleData:
+    __slots__ = ("ts", "net_consumption", "total_consumption", "total_production")
+
     def __init__(self, data, ts: datetime) -> None:
 
         # Do not use JSON data's timestamp. Envoy's clock is wrong
@@ -95,9 +124,41 @@ class SampleData:
                 # TODO: Parse this data too
                 pass
 
+    def iter_lines(self) -> Iterator[Tuple[str, int, 'EIMLineSample']]:
+        """
+        Iterate over all line samples as: (measurement type, line index, sample)
+        """
+        eims = (
+            ("consumption", self.total_consumption),
+            ("production", self.total_production),
+            ("net", self.net_consumption),
+        )
+        for measurement_type, eim in eims:
+            if eim is None:
+                continue
+            for idx, line in enumerate(eim.lines):
+                yield measurement_type, idx, line
+
+
+def loads(body: bytes):
+    """
+    Decode a JSON response body using the fastest available backend
+    """
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+def parse_power_data(body: bytes, ts: datetime) -> SampleData:
+    """
+    Parse a production.json?details=1 response body
+    """
+    return SampleData(loads(body), ts)
+
 
 #===============================================================================
 class InverterSample:
+    __slots__ = ("ts", "serial", "report_ts", "watts")
+
     def __init__(self, data, ts: datetime) -> None:
         # envoy time is not particularly accurate. Use my own ts
         self.ts = ts
@@ -137,3 +198,117 @@ def filter_new_inverter_data(new_data: Dict[str, InverterSample], prev_data: Dic
             continue
 
     return unique_inverters
+
+class InverterTable:
+    """
+    Columnar record of the most recent report of each inverter.
+
+    Serials are given a stable row the first time they are seen. Each tick,
+    the reported timestamps are compared against the table in one go, and
+    samples are only built for the inverters that have a new report.
+    This is equivalent to parse_inverter_data() + filter_new_inverter_data(),
+    but without building and holding onto a full dict of samples every tick.
+
+    With numpy, the comparison is vectorized, which keeps the per-tick cost
+    low for large installs. Otherwise, plain lists are used. Unless told
+    otherwise, numpy is only used if it is installed and the first report
+    lists at least NUMPY_MIN_INVERTERS inverters. Below that, the overhead of
+    converting to arrays outweighs the gain.
+    """
+    NUMPY_MIN_INVERTERS = 1024
+
+    def __init__(self, use_numpy: bool = None) -> None:
+        self.use_numpy = use_numpy
+
+        self.index = {} # type: Dict[str, int]
+        # Last report timestamp of each row. -1 if there has not been one
+        self.report_ts = None # type: Any
+
+        # Envoy lists inverters in the same order every time. Remember the
+        # last order so that rows only need to be looked up when it changes
+        self._serials = [] # type: List[str]
+        self._rows = [] # type: Any
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _update_rows(self, serials: List[str]) -> None:
+        rows = []
+        for serial in serials:
+            row = self.index.get(serial)
+            if row is None:
+                row = len(self.index)
+                self.index[serial] = row
+            rows.append(row)
+        self._serials = serials
+
+        n_new = len(self.index) - len(self.report_ts)
+        if self.use_numpy:
+            self._rows = np.array(rows, dtype=np.intp)
+            if n_new > 0:
+                self.report_ts = np.concatenate((self.report_ts, np.full(n_new, -1, dtype=np.int64)))
+        else:
+            self._rows = rows
+            self.report_ts.extend([-1] * n_new)
+
+    def update(self, data, ts: datetime) -> Dict[str, InverterSample]:
+        """
+        Parse the inverter JSON list, and return samples of the inverters that
+        reported since the last update, keyed by their serial number
+        """
+        if self.report_ts is None:
+            if self.use_numpy is None:
+                self.use_numpy = np is not None and len(data) >= self.NUMPY_MIN_INVERTERS
+            self.report_ts = np.zeros(0, dtype=np.int64) if self.use_numpy else []
+
+        serials = [inverter_data['serialNumber'] for inverter_data in data]
+        if serials != self._serials:
+            self._update_rows(serials)
+
+        if self.use_numpy:
+            report_ts = np.fromiter(
+                (inverter_data['lastReportDate'] for inverter_data in data),
+                dtype=np.int64, count=len(data),
+            )
+            changed = np.flatnonzero(report_ts != self.report_ts[self._rows]).tolist()
+            self.report_ts[self._rows] = report_ts
+        else:
+            changed = []
+            prev_report_ts = self.report_ts
+            for i, row in enumerate(self._rows):
+                report_ts = data[i]['lastReportDate']
+                if report_ts != prev_report_ts[row]:
+                    prev_report_ts[row] = report_ts
+                    changed.append(i)
+
+        return {serials[i]: InverterSample(data[i], ts) for i in changed}
+
+
+#===============================================================================
+class InventoryDevice:
+    """
+    A device listed in the envoy's inventory
+    """
+    __slots__ = ("device_type", "serial", "part_num", "dev_type", "status", "producing", "communicating")
+
+    def __init__(self, device_type: str, data) -> None:
+        # Inventory group the device is listed under. eg: "PCU" (inverters), "ACB", "NSRB"
+        self.device_type = device_type
+        self.serial = data['serial_num'] # type: str
+        self.part_num = data.get('part_num') # type: Optional[str]
+        self.dev_type = data.get('dev_type') # type: Optional[int]
+        self.status = tuple(data.get('device_status', ())) # type: Tuple[str, ...]
+        self.producing = data.get('producing') # type: Optional[bool]
+        self.communicating = data.get('communicating') # type: Optional[bool]
+
+def parse_inventory(data) -> Dict[str, InventoryDevice]:
+    """
+    Parse the inventory JSON and return a dictionary of devices, keyed by
+    their serial number
+    """
+    devices = {}
+    for group in data:
+        for device_data in group.get('devices', []):
+            device = InventoryDevice(group['type'], device_data)
+            devices[device.serial] = device
+    return devices
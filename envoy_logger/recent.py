@@ -0,0 +1,192 @@
+"""
+In-memory history of recent samples, for live views that would otherwise
+have to poll InfluxDB.
+"""
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import json
+import math
+import threading
+import time
+
+from .model import SampleData, InverterSample
+from .line_protocol import LineEncoder
+from .derived import compute_totals
+from .cfg import Config, EnvoyConfig, parse_duration
+from .http_api import HttpApi
+
+# Inverters report every 5 minutes. Size their history as if they reported
+# every minute, so it is not cut short
+INVERTER_REPORT_INTERVAL = 60
+
+NAN = float("nan")
+
+class SeriesRing:
+    """
+    Fixed-size ring buffer of a series' samples.
+
+    Storage for each field is allocated up front, so appending does not
+    allocate. A field that appears later gets its own storage then.
+    """
+    __slots__ = ("capacity", "times", "values", "head", "count")
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.values = {} # type: Dict[str, array]
+        # Index of the next slot to write
+        self.head = 0
+        self.count = 0
+
+    def append(self, t: float, fields: Iterable[Tuple[str, Any]]) -> None:
+        i = self.head
+        self.times[i] = t
+        written = 0
+        for k, v in fields:
+            values = self.values.get(k)
+            if values is None:
+                values = self.values[k] = array('d', [NAN]) * self.capacity
+            values[i] = NAN if v is None else v
+            written += 1
+        if written != len(self.values):
+            # Some fields were missing from this sample
+            present = {k for k, _ in fields}
+            for k, values in self.values.items():
+                if k not in present:
+                    values[i] = NAN
+        self.head = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def _indexes(self, since: float) -> Iterator[int]:
+        """
+        Slots of samples at or after since, newest first
+        """
+        i = self.head
+        for _ in range(self.count):
+            i = (i - 1) % self.capacity
+            if self.times[i] < since:
+                break
+            yield i
+
+    def window(self, since: float) -> Optional[Dict[str, Any]]:
+        """
+        Latest values, and mean/min/max of each field over samples at or after since
+        """
+        indexes = list(self._indexes(since))
+        if not indexes:
+            return None
+        fields = {}
+        for k, values in self.values.items():
+            window = [values[i] for i in indexes if not math.isnan(values[i])]
+            if not window:
+                continue
+            fields[k] = {
+                "last": window[0],
+                "mean": sum(window) / len(window),
+                "min": min(window),
+                "max": max(window),
+            }
+        return {
+            "time": int(self.times[indexes[0]] * 1000),
+            "count": len(indexes),
+            "fields": fields,
+        }
+
+
+class RecentSamples:
+    """
+    Recent samples of one envoy's lines, per type totals and inverters.
+
+    Series are named after their InfluxDB measurement.
+    Written by the sampling loop, and read by the HTTP API's threads.
+    """
+    def __init__(self, history: float, interval: float, totals: bool = True) -> None:
+        self.line_capacity = math.ceil(history / interval) + 1
+        self.inverter_capacity = math.ceil(history / max(interval, INVERTER_REPORT_INTERVAL)) + 1
+        self.totals = totals
+        self.series = {} # type: Dict[str, SeriesRing]
+        self.lock = threading.Lock()
+
+    def _append(self, name: str, capacity: int, t: float, fields: Iterable[Tuple[str, Any]]) -> None:
+        ring = self.series.get(name)
+        if ring is None:
+            ring = self.series[name] = SeriesRing(capacity)
+        ring.append(t, fields)
+
+    def add_sample(self, encoder: LineEncoder, data: SampleData, inverter_data: Dict[str, InverterSample]) -> None:
+        t = data.ts.timestamp()
+        totals = compute_totals(data) if self.totals else {}
+        with self.lock:
+            for measurement_type, idx, line in data.iter_lines():
+                self._append(f"{measurement_type}-line{idx}", self.line_capacity, t, encoder.line_fields(line))
+            for measurement_type, fields in totals.items():
+                self._append(f"{measurement_type}-total", self.line_capacity, t, fields.items())
+            for inverter in inverter_data.values():
+                self._append(
+                    f"inverter-production-{inverter.serial}", self.inverter_capacity,
+                    inverter.ts.timestamp(), encoder.inverter_fields(inverter)
+                )
+
+    def window(self, seconds: float, names: List[str] = None) -> Dict[str, Any]:
+        since = time.time() - seconds
+        result = {}
+        with self.lock:
+            for name, ring in self.series.items():
+                if names and name not in names:
+                    continue
+                summary = ring.window(since)
+                if summary is not None:
+                    result[name] = summary
+        return result
+
+
+class LiveData:
+    """
+    Recent samples of every envoy, served from the local HTTP API:
+        /live?window=5m[&source=...][&series=...]
+            JSON snapshot of each series: last value, and mean/min/max over
+            the window
+        /live/stream?window=5m[&interval=5s][&source=...][&series=...]
+            The same, as server-sent events every interval
+    """
+    def __init__(self, cfg: Config) -> None:
+        self.cfg = cfg
+        # Created up front, so that the HTTP API's threads can iterate it
+        # while envoys are (re)started
+        self.envoys = {
+            envoy_cfg.source_tag: RecentSamples(cfg.live_history, cfg.sampling_interval, cfg.derived_fields)
+            for envoy_cfg in cfg.envoys
+        } # type: Dict[str, RecentSamples]
+
+    def get(self, envoy_cfg: EnvoyConfig) -> RecentSamples:
+        return self.envoys[envoy_cfg.source_tag]
+
+    def snapshot(self, query: Dict[str, List[str]]) -> Dict[str, Any]:
+        seconds = parse_duration(query.get("window", ["5m"])[0])
+        if seconds <= 0 or seconds > self.cfg.live_history:
+            raise ValueError(f"window must be within the live history ({self.cfg.live_history:g}s)")
+        sources = query.get("source")
+        names = query.get("series")
+        return {
+            source: recent.window(seconds, names)
+            for source, recent in self.envoys.items()
+            if not sources or source in sources
+        }
+
+    def get_json(self, query: Dict[str, List[str]]) -> Tuple[str, bytes]:
+        return "application/json", json.dumps(self.snapshot(query)).encode("utf-8")
+
+    def stream(self, query: Dict[str, List[str]]) -> Iterator[bytes]:
+        interval = parse_duration(query.get("interval", [self.cfg.sampling_interval])[0])
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        # Check the query before anything is sent
+        event = self.snapshot(query)
+        while True:
+            yield b"data: " + json.dumps(event).encode("utf-8") + b"\n\n"
+            time.sleep(interval)
+            event = self.snapshot(query)
+
+    def add_routes(self, http_api: HttpApi) -> None:
+        http_api.add_route("/live", self.get_json)
+        http_api.add_stream_route("/live/stream", self.stream)
@@ -1,35 +1,120 @@
-from datetime import datetime, date
+from datetime import datetime, date, timezone
 import time
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple, Union, TYPE_CHECKING
 import logging
-from requests.exceptions import ReadTimeout, ConnectTimeout
-
-from influxdb_client import WritePrecision, InfluxDBClient, Point
-from influxdb_client.client.write_api import SYNCHRONOUS
+import os
+from concurrent.futures import ThreadPoolExecutor, Future
+from requests.exceptions import ReadTimeout, ConnectTimeout, HTTPError, RequestException
 
 from . import envoy
-from .model import SampleData, PowerSample, InverterSample, filter_new_inverter_data
-from .cfg import Config
+from .model import SampleData, InverterSample, InverterTable
+from .cfg import Config, EnvoyConfig
+from .enphaseenergy import TokenManager
+from .writer import BatchWriter
+from .sinks import SinkSet
+from .line_protocol import LineEncoder, encode_line
+from .energy import EnergyAccumulator, SeriesKey
+from .downsample import DownsampleTier
+from .deadband import DeadbandFilter
+from .inventory import InventoryIndex
+from .daily_summary import DailySummaryQuery
+from . import metrics
+from .scheduler import TickScheduler, AdaptiveInterval
+from .inverter_poll import InverterPollSchedule
+from .recent import RecentSamples
+
+if TYPE_CHECKING:
+    from influxdb_client import InfluxDBClient, Point
 
 class SamplingLoop:
-    interval = 5
-
-    def __init__(self, token: str, cfg: Config) -> None:
+    def __init__(self, token_manager: TokenManager, cfg: Config, envoy_cfg: EnvoyConfig, influxdb_client: 'InfluxDBClient', writer: Union[SinkSet, BatchWriter], recent: RecentSamples = None) -> None:
         self.cfg = cfg
-        self.session_id = envoy.login(self.cfg.envoy_url, token)
+        self.envoy_cfg = envoy_cfg
+        self.envoy = envoy.EnvoyClient(
+            envoy_cfg.url,
+            pool_size=envoy_cfg.pool_size,
+            retries=envoy_cfg.retries,
+            name=envoy_cfg.source_tag,
+        )
+        # Log in again whenever the token is refreshed
+        self.token_manager = token_manager
+        self.envoy.login(token_manager.token)
+        token_manager.add_listener(self.envoy.login)
+        metrics.ENVOY_CONNECTIONS.labels(envoy=envoy_cfg.source_tag).set_function(
+            lambda: self.envoy.connection_count
+        )
+        self.scheduler = TickScheduler(
+            cfg.sampling_interval,
+            policy=cfg.sampling_overrun_policy,
+            name=envoy_cfg.source_tag,
+        )
+        self.adaptive_interval = None # type: Optional[AdaptiveInterval]
+        if cfg.sampling_max_interval > cfg.sampling_interval:
+            self.adaptive_interval = AdaptiveInterval(
+                cfg.sampling_interval,
+                cfg.sampling_max_interval,
+                cfg.sampling_change_threshold,
+            )
+        metrics.SAMPLING_INTERVAL_SECONDS.labels(envoy=envoy_cfg.source_tag).set_function(
+            lambda: self.scheduler.current_interval
+        )
 
-        influxdb_client = InfluxDBClient(
-            url=cfg.influxdb_url,
-            token=cfg.influxdb_token,
-            org=cfg.influxdb_org
+        # Points are handed off to the writer, which sends them to InfluxDB in
+        # the background
+        self.writer = writer
+        # Optional in-memory history for live views
+        self.recent = recent
+        self.inventory = InventoryIndex(envoy_cfg, cfg.inventory_tags)
+        self.encoder = LineEncoder(envoy_cfg, inventory=self.inventory, derived=cfg.derived_fields)
+        self.daily_summary_query = DailySummaryQuery(
+            influxdb_client,
+            cfg.influxdb_bucket_hr,
+            envoy_cfg.source_tag,
+            workers=cfg.daily_summary_query_workers,
+            serial_group_size=cfg.daily_summary_serial_group_size,
+            retries=cfg.daily_summary_query_retries,
         )
-        self.influxdb_write_api = influxdb_client.write_api(write_options=SYNCHRONOUS)
-        self.influxdb_query_api = influxdb_client.query_api()
+        self.summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="daily-summary")
 
         # Used to track the transition to the next day for daily measurements
         self.todays_date = date.today()
 
-        self.prev_inverter_data = None
+        # Daily energy totals are integrated as samples arrive
+        self.energy = EnergyAccumulator(
+            os.path.join(cfg.daily_summary_checkpoint_dir, f"{envoy_cfg.serial}.json"),
+            checkpoint_interval=cfg.daily_summary_checkpoint_interval,
+            gap_threshold=cfg.backfill_min_gap,
+        )
+        # Encodes points that fill in gaps
+        self.backfill_encoder = LineEncoder(envoy_cfg, {"backfill": "true"}, self.inventory)
+
+        self.deadband = None # type: Optional[DeadbandFilter]
+        if cfg.deadband_thresholds:
+            self.deadband = DeadbandFilter(cfg.deadband_thresholds, cfg.deadband_max_silence)
+
+        self.downsample_tiers = [
+            DownsampleTier(envoy_cfg, tier_cfg.window, tier_cfg.bucket, self.inventory, cfg.derived_fields)
+            for tier_cfg in cfg.downsample_tiers
+        ]
+
+        # Most recent report of each inverter, to filter out stale ones
+        self.inverter_table = InverterTable()
+        self.inverters_primed = False
+        # Only request inverter data when new reports are expected
+        self.inverter_poll = None # type: Optional[InverterPollSchedule]
+        if cfg.inverter_poll_mode == "cadence":
+            self.inverter_poll = InverterPollSchedule(
+                cfg.inverter_poll_min_interval,
+                cfg.inverter_poll_safety_interval,
+                envoy_cfg.source_tag,
+            )
+
+        # Envoy requests are issued concurrently so that a slow endpoint does
+        # not hold up the others
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="envoy-fetch")
+        self.inverter_future = None # type: Optional[Future]
+        self.inventory_future = None # type: Optional[Future]
+        self.next_inventory_refresh = time.monotonic()
 
     def run(self):
         timeout_count = 0
@@ -43,97 +128,230 @@ class SamplingLoop:
                 # It's software gets hung up for some reason, and some requests will stall.
                 # Allow envoy requests to timeout (and skip this sample iteration)
                 timeout_count += 1
-                logging.warning("Envoy request timed out (%d/10)", timeout_count)
+                metrics.ENVOY_TIMEOUTS.labels(envoy=self.envoy_cfg.source_tag).inc()
+                logging.warning("Envoy %s request timed out (%d/10)", self.envoy_cfg.url, timeout_count)
                 if timeout_count >= 10:
                     # Give up after a while
                     raise
                 pass
+            except HTTPError as e:
+                if e.response is None or e.response.status_code != 401:
+                    raise
+                # Session was invalidated (envoy rebooted, token expired, etc).
+                # Log in again and carry on from the next tick.
+                logging.warning("Envoy %s session is no longer valid. Logging in again", self.envoy_cfg.url)
+                self.envoy.login(self.token_manager.token)
+                # Any inverter request in flight used the old session. Its reports
+                # were never applied, so the next request picks them up
+                self.inverter_future = None
             else:
                 self.write_to_influxdb(data, inverter_data)
                 timeout_count = 0
 
+    def close(self) -> None:
+        """
+        Detach from resources that outlive this sampling loop
+        """
+        self.token_manager.remove_listener(self.envoy.login)
+        self.executor.shutdown(wait=False)
+        self.summary_executor.shutdown(wait=False)
+
     def get_sample(self) -> SampleData:
-        # Determine how long until the next sample needs to be taken
-        now = datetime.now()
-        time_to_next = self.interval - (now.timestamp() % self.interval)
+        # Wait for the next tick. Samples are timestamped with the tick's
+        # planned time rather than whenever the request happened to complete
+        tick = self.scheduler.wait()
+        ts = datetime.fromtimestamp(tick, timezone.utc)
+
+        # Kick off the inverter request in the background. If the previous one
+        # is still in flight, let it finish rather than piling up more.
+        if self.inverter_future is None and self.inverter_poll_due():
+            metrics.INVERTER_POLLS.labels(envoy=self.envoy_cfg.source_tag).inc()
+            self.inverter_future = self.executor.submit(self.fetch_inverter_data, ts)
+
+        data = self.envoy.get_power_data(ts)
 
-        # wait!
-        time.sleep(time_to_next)
+        if self.adaptive_interval is not None:
+            self.scheduler.set_interval(self.adaptive_interval.update(data))
 
-        data = envoy.get_power_data(self.cfg.envoy_url, self.session_id)
+        self.refresh_inventory()
 
         return data
 
+    def inverter_poll_due(self) -> bool:
+        if self.inverter_poll is None:
+            return True
+        now = time.monotonic()
+        if not self.inverter_poll.due(now):
+            return False
+        self.inverter_poll.polled(now)
+        return True
+
+    def refresh_inventory(self) -> None:
+        """
+        Periodically re-read the envoy's inventory in the background
+        """
+        if self.inventory_future is not None:
+            if not self.inventory_future.done():
+                return
+            future = self.inventory_future
+            self.inventory_future = None
+            try:
+                self.inventory.update(future.result())
+            except (RequestException, ValueError, KeyError) as e:
+                # Not critical. Keep using the previous inventory
+                logging.warning("Failed to read envoy %s inventory: %s", self.envoy_cfg.url, e)
+        elif self.cfg.inventory_refresh_interval and time.monotonic() >= self.next_inventory_refresh:
+            self.next_inventory_refresh = time.monotonic() + self.cfg.inventory_refresh_interval
+            self.inventory_future = self.executor.submit(self.envoy.get_inventory)
+
     def get_inverter_data(self) -> Dict[str, InverterSample]:
-        data = envoy.get_inverter_data(self.cfg.envoy_url, self.session_id)
+        # Only collect the inverter result if it is ready. Otherwise it gets
+        # picked up on a later tick. Samples keep their own timestamp either way.
+        if self.inverter_future is None or not self.inverter_future.done():
+            return {}
+        future = self.inverter_future
+        self.inverter_future = None
+        try:
+            ts, reports = future.result()
+            # The table is only touched here, on the sampling thread. A fetch
+            # that gets dropped leaves it as it was, so the next one still
+            # sees those reports as new
+            filtered_data = self.inverter_table.update(reports, ts)
+        except (RequestException, ValueError, KeyError) as e:
+            # Don't let it take the tick's power sample down with it. Inverter
+            # reports are picked up again by a later fetch
+            metrics.INVERTER_FETCH_ERRORS.labels(envoy=self.envoy_cfg.source_tag).inc()
+            logging.warning("Failed to read envoy %s inverter data: %s", self.envoy_cfg.url, e)
+            return {}
+        if self.inverter_poll is not None:
+            self.inverter_poll.observe(filtered_data, time.monotonic())
 
-        if self.prev_inverter_data is None:
-            self.prev_inverter_data = data
+        if not self.inverters_primed:
+            self.inverters_primed = True
+            if self.cfg.backfill_min_gap is not None:
+                return self.backfill_inverter_data(filtered_data)
             # Hard to know how stale inverter data is, so discard this sample
             # since I have nothing to compare to yet
             return {}
 
-        # filter out stale inverter samples
-        filtered_data = filter_new_inverter_data(data, self.prev_inverter_data)
+        metrics.FILTERED_INVERTER_SAMPLES.labels(envoy=self.envoy_cfg.source_tag).inc(
+            len(reports) - len(filtered_data)
+        )
         if filtered_data:
             logging.debug("Got %d unique inverter measurements", len(filtered_data))
-        self.prev_inverter_data = data
         return filtered_data
 
+    def fetch_inverter_data(self, ts: datetime) -> Tuple[datetime, List[dict]]:
+        """
+        Runs in the background.
+        Returns the tick the request was made for, and the raw inverter reports.
+        """
+        return ts, self.envoy.get_inverter_reports()
+
     def write_to_influxdb(self, data: SampleData, inverter_data: Dict[str, InverterSample]) -> None:
-        hr_points = self.get_high_rate_points(data, inverter_data)
+        with metrics.POINT_BUILD_SECONDS.labels(envoy=self.envoy_cfg.source_tag).time():
+            hr_points = self.get_high_rate_points(data, inverter_data)
         lr_points = self.low_rate_points(data)
-        self.influxdb_write_api.write(bucket=self.cfg.influxdb_bucket_hr, record=hr_points)
+        self.writer.put(self.cfg.influxdb_bucket_hr, hr_points)
         if lr_points:
-            self.influxdb_write_api.write(bucket=self.cfg.influxdb_bucket_lr, record=lr_points)
+            self.writer.put(self.cfg.influxdb_bucket_lr, lr_points)
 
-    def get_high_rate_points(self, data: SampleData, inverter_data: Dict[str, InverterSample]) -> List[Point]:
-        points = []
-        for i, line in enumerate(data.total_consumption.lines):
-            p = self.idb_point_from_line("consumption", i, line)
-            points.append(p)
-        for i, line in enumerate(data.total_production.lines):
-            p = self.idb_point_from_line("production", i, line)
-            points.append(p)
-        for i, line in enumerate(data.net_consumption.lines):
-            p = self.idb_point_from_line("net", i, line)
-            points.append(p)
+        if self.recent is not None:
+            self.recent.add_sample(self.encoder, data, inverter_data)
 
-        for inverter in inverter_data.values():
-            p = self.point_from_inverter(inverter)
-            points.append(p)
+        for tier in self.downsample_tiers:
+            tier_points = tier.add_sample(data, inverter_data)
+            if tier_points:
+                self.writer.put(tier.bucket, tier_points)
 
-        return points
+        backfill_points = self.accumulate_energy(data, inverter_data)
+        if backfill_points:
+            self.writer.put(self.cfg.influxdb_bucket_hr, backfill_points)
 
-    def idb_point_from_line(self, measurement_type: str, idx: int, data: PowerSample) -> Point:
-        p = Point(f"{measurement_type}-line{idx}")
-        p.time(data.ts, WritePrecision.S)
-        p.tag("source", self.cfg.source_tag)
-        p.tag("measurement-type", measurement_type)
-        p.tag("line-idx", idx)
+    def get_high_rate_points(self, data: SampleData, inverter_data: Dict[str, InverterSample]) -> List[str]:
+        points = []
+        for measurement_type, idx, line in data.iter_lines():
+            point = self.encoder.encode_line_sample(measurement_type, idx, line)
+            if self.deadband is None:
+                points.append(point)
+            else:
+                points.extend(self.deadband.filter(
+                    (measurement_type, str(idx)), self.encoder.line_fields(line), line.ts.timestamp(), point
+                ))
 
-        p.field("P", data.wNow)
-        p.field("Q", data.reactPwr)
-        p.field("S", data.apprntPwr)
+        if self.cfg.derived_fields:
+            points.extend(self.encoder.encode_totals(data))
 
-        p.field("I_rms", data.rmsCurrent)
-        p.field("V_rms", data.rmsVoltage)
+        for inverter in inverter_data.values():
+            points.append(self.encoder.encode_inverter_sample(inverter))
+
+        return points
 
-        return p
+    def accumulate_energy(self, data: SampleData, inverter_data: Dict[str, InverterSample]) -> List[str]:
+        """
+        Add the sample to the daily energy totals.
 
-    def point_from_inverter(self, inverter: InverterSample) -> Point:
-        p = Point(f"inverter-production-{inverter.serial}")
-        p.time(inverter.ts, WritePrecision.S)
-        p.tag("source", self.cfg.source_tag)
-        p.tag("measurement-type", "inverter")
-        p.tag("serial", inverter.serial)
-        self.cfg.apply_tags_to_inverter_point(p, inverter.serial)
+        Returns backfill points for any gaps whose energy came from the
+        envoy's counters
+        """
+        backfill_points = []
+        # Energy of each type's gaps, summed over its lines
+        total_gaps = {} # type: Dict[Tuple[str, float, float], float]
+        for measurement_type, idx, line in data.iter_lines():
+            gap = self.energy.add((measurement_type, str(idx)), line.ts, line.wNow, line.whLifetime)
+            if gap is not None:
+                backfill_points.extend(self.backfill_line_points(measurement_type, idx, *gap))
+                start, end, Wh = gap
+                key = (measurement_type, start, end)
+                total_gaps[key] = total_gaps.get(key, 0.0) + Wh
+        if self.cfg.derived_fields:
+            for (measurement_type, start, end), Wh in total_gaps.items():
+                prefix = self.backfill_encoder.total_prefix(measurement_type)
+                backfill_points.extend(self.backfill_points(prefix, start, end, Wh))
+        for inverter in inverter_data.values():
+            self.energy.add(("inverter", inverter.serial), inverter.ts, inverter.watts)
+        self.energy.maybe_checkpoint()
+        return backfill_points
 
-        p.field("P", inverter.watts)
+    def backfill_line_points(self, measurement_type: str, idx: int, start: float, end: float, Wh: float) -> List[str]:
+        """
+        Fill a gap with points at the average power over it, so that it reads
+        correctly on dashboards and in Flux integrals
+        """
+        logging.info(
+            "Backfilling %s line %d: %.1f Wh from %s to %s", measurement_type, idx, Wh,
+            datetime.fromtimestamp(start, timezone.utc), datetime.fromtimestamp(end, timezone.utc)
+        )
+        prefix = self.backfill_encoder.line_prefix(measurement_type, idx)
+        return self.backfill_points(prefix, start, end, Wh)
 
-        return p
+    def backfill_points(self, prefix: str, start: float, end: float, Wh: float) -> List[str]:
+        """
+        Points of a series every backfill_resolution over a gap, at its average power
+        """
+        fields = (("P", Wh * 3600 / (end - start)),)
+        step = self.cfg.backfill_resolution
+        points = []
+        t = start + step
+        while t < end:
+            points.append(encode_line(prefix, fields, datetime.fromtimestamp(t, timezone.utc)))
+            t += step
+        return points
 
-    def low_rate_points(self, data: SampleData) -> List[Point]:
+    def backfill_inverter_data(self, data: Dict[str, InverterSample]) -> Dict[str, InverterSample]:
+        """
+        After a restart, keep inverter reports that were made while the logger
+        was down. They are timestamped with the time the inverter reported.
+        """
+        reports = {}
+        for serial, inverter in data.items():
+            last_t = self.energy.last_timestamp(("inverter", serial))
+            if last_t is not None and inverter.report_ts > last_t:
+                inverter.ts = datetime.fromtimestamp(inverter.report_ts, timezone.utc)
+                reports[serial] = inverter
+        return reports
+
+    def low_rate_points(self, data: SampleData) -> List['Point']:
         # First check if the day rolled over
         new_date = date.today()
         if self.todays_date == new_date:
@@ -144,59 +362,113 @@ class SamplingLoop:
         self.todays_date = new_date
 
         # Collect points that summarize prior day
-        points = self.compute_daily_Wh_points(data.ts)
+        totals = self.energy.rollover()
+        if self.cfg.daily_summary_mode == "accumulate":
+            return self.compute_daily_Wh_points(totals, data.ts)
 
-        return points
+        # Querying InfluxDB takes a while. Do it in the background so that
+        # sampling carries on
+        self.summary_executor.submit(self.write_daily_summary, totals, data.ts)
+        return []
 
-    def compute_daily_Wh_points(self, ts: datetime) -> List[Point]:
-        # Not using integral(interpolate:"linear") since it does not do what you
-        # think it would mean. Without the "interoplation" arg, it still does
-        # linear interpolation correctly.
-        # https://github.com/influxdata/flux/issues/4782
-        query = f"""
-        from(bucket: "{self.cfg.influxdb_bucket_hr}")
-            |> range(start: -24h, stop: 0h)
-            |> filter(fn: (r) => r["source"] == "{self.cfg.source_tag}")
-            |> filter(fn: (r) => r["_field"] == "P")
-            |> integral(unit: 1h)
-            |> keep(columns: ["_value", "line-idx", "measurement-type", "serial"])
-            |> yield(name: "total")
-        """
-        result = self.influxdb_query_api.query(query=query)
-        unreported_inverters = set(self.cfg.inverters.keys())
-        points = []
-        for table in result:
-            for record in table.records:
-                measurement_type = record['measurement-type']
-                if measurement_type == "inverter":
-                    serial = record['serial']
-                    unreported_inverters.discard(serial)
-                    p = Point(f"inverter-daily-summary-{serial}")
-                    p.tag("serial", serial)
-                    self.cfg.apply_tags_to_inverter_point(p, serial)
+    def write_daily_summary(self, totals: Dict[SeriesKey, float], ts: datetime) -> None:
+        """
+        Query the prior day's energy from InfluxDB, and write the summary
+        """
+        try:
+            inverter_serials = self.inventory.inverter_serials
+            inverter_serials.update(ident for kind, ident in totals if kind == "inverter")
+            try:
+                reference = self.daily_summary_query.run(inverter_serials)
+            except Exception as e:
+                logging.error("Daily summary query failed: %s. Using accumulated totals instead", e)
+            else:
+                if self.cfg.daily_summary_mode == "flux":
+                    totals = reference
                 else:
-                    idx = record['line-idx']
-                    p = Point(f"{measurement_type}-daily-summary-line{idx}")
-                    p.tag("line-idx", idx)
+                    self.verify_daily_Wh(totals, reference)
 
-                p.time(ts, WritePrecision.S)
-                p.tag("source", self.cfg.source_tag)
-                p.tag("measurement-type", measurement_type)
-                p.tag("interval", "24h")
+            self.writer.put(self.cfg.influxdb_bucket_lr, self.compute_daily_Wh_points(totals, ts))
+        except Exception:
+            logging.exception("Failed to write daily summary")
 
-                p.field("Wh", record.get_value())
-                points.append(p)
+    def verify_daily_Wh(self, totals: Dict[SeriesKey, float], reference: Dict[SeriesKey, float]) -> None:
+        """
+        Compare accumulated daily energy against the Flux integral
+        """
+        for key in sorted(set(totals) | set(reference)):
+            Wh = totals.get(key, 0.0)
+            ref_Wh = reference.get(key, 0.0)
+            if abs(Wh - ref_Wh) > max(1.0, 0.01 * abs(ref_Wh)):
+                logging.warning(
+                    "Daily energy mismatch for %s: accumulated %.1f Wh, Flux integral %.1f Wh",
+                    "/".join(key), Wh, ref_Wh
+                )
+
+    def compute_daily_Wh_points(self, totals: Dict[SeriesKey, float], ts: datetime) -> List['Point']:
+        # Only needed once a day. influxdb_client is slow to import
+        from influxdb_client import Point, WritePrecision
+
+        unreported_inverters = self.inventory.inverter_serials
+        points = []
+        for (measurement_type, ident), Wh in totals.items():
+            if measurement_type == "inverter":
+                serial = ident
+                unreported_inverters.discard(serial)
+                p = Point(f"inverter-daily-summary-{serial}")
+                p.tag("serial", serial)
+                for k, v in self.inventory.inverter_tags(serial):
+                    p.tag(k, v)
+            else:
+                idx = ident
+                p = Point(f"{measurement_type}-daily-summary-line{idx}")
+                p.tag("line-idx", idx)
+
+            p.time(ts, WritePrecision.MS)
+            p.tag("source", self.envoy_cfg.source_tag)
+            p.tag("measurement-type", measurement_type)
+            p.tag("interval", "24h")
+
+            p.field("Wh", Wh)
+            points.append(p)
+
+        if self.cfg.derived_fields:
+            points.extend(self.compute_daily_total_Wh_points(totals, ts))
 
         # If any inverters did not report in for the day, fill in a 0wh measurement
         for serial in unreported_inverters:
             p = Point(f"inverter-daily-summary-{serial}")
             p.tag("serial", serial)
-            self.cfg.apply_tags_to_inverter_point(p, serial)
-            p.time(ts, WritePrecision.S)
-            p.tag("source", self.cfg.source_tag)
-            p.tag("measurement-type", measurement_type)
+            for k, v in self.inventory.inverter_tags(serial):
+                p.tag(k, v)
+            p.time(ts, WritePrecision.MS)
+            p.tag("source", self.envoy_cfg.source_tag)
+            p.tag("measurement-type", "inverter")
             p.tag("interval", "24h")
             p.field("Wh", 0.0)
             points.append(p)
 
         return points
+
+    def compute_daily_total_Wh_points(self, totals: Dict[SeriesKey, float], ts: datetime) -> List['Point']:
+        """
+        All-lines daily total of each measurement type
+        """
+        from influxdb_client import Point, WritePrecision
+
+        type_totals = {} # type: Dict[str, float]
+        for (measurement_type, _), Wh in totals.items():
+            if measurement_type == "inverter":
+                continue
+            type_totals[measurement_type] = type_totals.get(measurement_type, 0.0) + Wh
+
+        points = []
+        for measurement_type, Wh in type_totals.items():
+            p = Point(f"{measurement_type}-daily-summary-total")
+            p.time(ts, WritePrecision.MS)
+            p.tag("source", self.envoy_cfg.source_tag)
+            p.tag("measurement-type", f"{measurement_type}-total")
+            p.tag("interval", "24h")
+            p.field("Wh", Wh)
+            points.append(p)
+        return points
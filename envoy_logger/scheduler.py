@@ -0,0 +1,146 @@
+from typing import Dict, Optional, Tuple
+import math
+import time
+import logging
+
+from .model import SampleData
+from . import metrics
+
+LOG = logging.getLogger("scheduler")
+
+class TickScheduler:
+    """
+    Produces sampling ticks aligned to wall-clock multiples of the interval.
+
+    Waiting is timed against the monotonic clock so that ticks do not drift,
+    and intervals can be fractional. Ticks are numbered, and each tick's
+    planned time is computed from its number rather than accumulated, so
+    floating point error does not build up either.
+
+    Ticks can be spread further apart with set_interval(), in whole multiples
+    of the base interval.
+
+    If a tick is late by a whole interval or more (the previous one overran),
+    the overrun policy decides what happens:
+        "skip": Skip ahead to the most recent tick. Missed ticks are counted
+        "catch-up": Run the missed ticks back to back until caught up, as long
+            as no more than max_catch_up are pending. Beyond that, skip.
+    """
+    def __init__(self, interval: float, policy: str = "skip", max_catch_up: int = 10, name: str = "") -> None:
+        if policy not in ("skip", "catch-up"):
+            raise ValueError(f"Invalid overrun policy: {policy}")
+        self.interval = interval
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self.name = name
+        # Ticks are step base intervals apart
+        self.step = 1
+
+        self.overrun_count = 0
+        self.missed_count = 0
+        self._catching_up = False
+
+        self._sync_clocks()
+        self._last_tick = math.floor(time.time() / self.interval)
+        self._next_tick = self._last_tick + 1
+
+    @property
+    def current_interval(self) -> float:
+        return self.step * self.interval
+
+    def set_interval(self, interval: float) -> None:
+        """
+        Change the time between ticks, starting with the next one.
+        Rounded down to a whole multiple of the base interval. Ticks stay
+        aligned to multiples of the new interval.
+        """
+        self.step = max(int(interval / self.interval + 1e-9), 1)
+        self._next_tick = (self._last_tick // self.step + 1) * self.step
+
+    def _sync_clocks(self) -> None:
+        self._wall0 = time.time()
+        self._mono0 = time.monotonic()
+
+    def _wall_now(self) -> float:
+        return self._wall0 + (time.monotonic() - self._mono0)
+
+    def wait(self) -> float:
+        """
+        Sleep until the next tick, and return its planned wall-clock time
+        """
+        # Re-sync if the wall clock was stepped (NTP, RTC fix on boot, etc)
+        if abs(self._wall_now() - time.time()) > 1.0:
+            LOG.warning("System clock changed. Re-aligning sampling ticks")
+            self._sync_clocks()
+            self._last_tick = math.floor(time.time() / self.interval)
+            self._next_tick = (self._last_tick // self.step + 1) * self.step
+
+        n = self._next_tick
+        delay = n * self.interval - self._wall_now()
+        if delay > 0:
+            self._catching_up = False
+            time.sleep(delay)
+        elif -delay >= self.interval:
+            # Overran by at least a whole tick
+            behind = math.floor(-delay / self.interval)
+            if not self._catching_up:
+                self.overrun_count += 1
+                metrics.TICK_OVERRUNS.labels(envoy=self.name).inc()
+            if self.policy == "skip" or behind > self.max_catch_up:
+                n += behind
+                self.missed_count += behind
+                self._catching_up = False
+                metrics.SKIPPED_TICKS.labels(envoy=self.name).inc(behind)
+                LOG.warning("%s: Sampling overran. Skipped %d ticks", self.name, behind)
+            else:
+                self._catching_up = True
+                LOG.debug("%s: Sampling overran. Catching up %d ticks", self.name, behind)
+
+        tick = n * self.interval
+        metrics.TICK_JITTER_SECONDS.labels(envoy=self.name).observe(max(self._wall_now() - tick, 0))
+        self._last_tick = n
+        self._next_tick = (n // self.step + 1) * self.step
+        return tick
+
+
+class AdaptiveInterval:
+    """
+    Picks the sampling interval based on how much the lines' power is changing.
+
+    If any line's power changed by change_threshold (W) or more since the
+    previous sample, sampling speeds up to min_interval. Otherwise it slows
+    down, doubling the interval each sample up to max_interval. At night
+    (production below idle_power) it drops straight to max_interval.
+    """
+    def __init__(self, min_interval: float, max_interval: float, change_threshold: float = 50, idle_power: float = 10) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.change_threshold = change_threshold
+        self.idle_power = idle_power
+
+        self.interval = min_interval
+        # Power of each line in the previous sample
+        self.prev_P = {} # type: Dict[Tuple[str, int], float]
+
+    def update(self, data: SampleData) -> float:
+        """
+        Returns the interval to use until the next sample
+        """
+        change = 0.0
+        production = None # type: Optional[float]
+        for measurement_type, idx, line in data.iter_lines():
+            key = (measurement_type, idx)
+            prev = self.prev_P.get(key)
+            if prev is not None:
+                change = max(change, abs(line.wNow - prev))
+            self.prev_P[key] = line.wNow
+            if measurement_type == "production":
+                production = (production or 0.0) + line.wNow
+
+        if change >= self.change_threshold:
+            self.interval = self.min_interval
+        elif production is not None and production < self.idle_power:
+            self.interval = self.max_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+        return self.interval
@@ -0,0 +1,174 @@
+"""
+Outputs that points can be written to, alongside InfluxDB.
+
+Every output receives the same stream of line-protocol records, and gets its
+own BatchWriter so that it is batched independently, and a slow or
+unreachable output only backs up its own queue.
+"""
+from typing import Callable, Dict, List, Any, Optional
+import json
+import os
+import sys
+import sqlite3
+import logging
+
+from .writer import BatchWriter
+from .line_protocol import parse_line, to_line_protocol
+from .cfg import OutputConfig
+from . import metrics
+
+# paho-mqtt is only needed for the MQTT output
+try:
+    import paho.mqtt.client as mqtt
+except ImportError:
+    mqtt = None
+
+LOG = logging.getLogger("sinks")
+
+WriteFunction = Callable[[str, List[Any]], None]
+
+class SinkSet:
+    """
+    Fans records out to every output
+    """
+    def __init__(self) -> None:
+        self.writers = {} # type: Dict[str, BatchWriter]
+        self.buckets = {} # type: Dict[str, Optional[List[str]]]
+
+    def add(self, name: str, write: WriteFunction, buckets: List[str] = None, **kwargs) -> BatchWriter:
+        """
+        Add an output.
+        buckets: Only send it records for these buckets. Defaults to all
+        kwargs are passed to its BatchWriter
+        """
+        writer = BatchWriter(write, name=f"writer-{name}", **kwargs)
+        self.writers[name] = writer
+        self.buckets[name] = buckets
+        metrics.WRITE_QUEUE_DEPTH.labels(sink=name).set_function(lambda: writer.depth)
+        metrics.WRITE_QUEUE_DROPPED.labels(sink=name).set_function(lambda: writer.dropped_count)
+        return writer
+
+    @property
+    def depth(self) -> int:
+        return sum(writer.depth for writer in self.writers.values())
+
+    @property
+    def dropped_count(self) -> int:
+        return sum(writer.dropped_count for writer in self.writers.values())
+
+    def put(self, bucket: str, records: List[Any]) -> None:
+        # Encode once, rather than in every output
+        records = [to_line_protocol(record) for record in records]
+        for name, writer in self.writers.items():
+            buckets = self.buckets[name]
+            if buckets is None or bucket in buckets:
+                writer.put(bucket, records)
+
+    def close(self, timeout: float = None) -> None:
+        for writer in self.writers.values():
+            writer.close(timeout)
+
+
+class StdoutSink:
+    """
+    Prints line protocol to stdout. Logging goes to stderr, so this can be
+    piped into other tools.
+    """
+    def write(self, bucket: str, records: List[str]) -> None:
+        sys.stdout.write("\n".join(records) + "\n")
+        sys.stdout.flush()
+
+
+class SQLiteSink:
+    """
+    Local archive of all points in a SQLite database, one row per point.
+
+    Tags and fields are stored as JSON objects, and can be pulled apart with
+    SQLite's JSON functions. eg:
+        SELECT ts, json_extract(fields, '$.P') FROM points
+        WHERE measurement = 'production-line0' ORDER BY ts
+    Timestamps are in milliseconds.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        parent_dir = os.path.dirname(path)
+        if parent_dir:
+            os.makedirs(parent_dir, exist_ok=True)
+        # Only ever used from the output's writer thread, but it is created here
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS points ("
+            "bucket TEXT, measurement TEXT, ts INTEGER, tags TEXT, fields TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS points_measurement_ts ON points (measurement, ts)")
+        self.conn.commit()
+
+    def write(self, bucket: str, records: List[str]) -> None:
+        rows = []
+        for record in records:
+            measurement, tags, fields, ts = parse_line(record)
+            rows.append((bucket, measurement, ts, json.dumps(tags), json.dumps(fields)))
+        # Whole batch in one transaction
+        with self.conn:
+            self.conn.executemany("INSERT INTO points VALUES (?, ?, ?, ?, ?)", rows)
+
+
+class MQTTSink:
+    """
+    Publishes each point to an MQTT broker (eg: for Home Assistant) as:
+        topic: <topic_prefix>/<source tag>/<measurement>
+        payload: {"time": <ms>, "tags": {...}, <field>: <value>, ...}
+    """
+    def __init__(self, host: str, port: int = 1883, topic_prefix: str = "envoy-logger",
+                 username: str = None, password: str = None, qos: int = 0, retain: bool = False) -> None:
+        self.topic_prefix = topic_prefix
+        self.qos = qos
+        self.retain = retain
+
+        try:
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        except AttributeError:
+            # paho-mqtt < 2.0
+            self.client = mqtt.Client()
+        if username is not None:
+            self.client.username_pw_set(username, password)
+        # Connects, and reconnects, in the background
+        self.client.connect_async(host, port)
+        self.client.loop_start()
+
+    def write(self, bucket: str, records: List[str]) -> None:
+        if not self.client.is_connected():
+            # Writer holds onto the batch and retries
+            raise ConnectionError("Not connected to MQTT broker")
+        for record in records:
+            measurement, tags, fields, ts = parse_line(record)
+            topic = "/".join(part for part in (self.topic_prefix, tags.get("source"), measurement) if part)
+            payload = dict(fields)
+            payload["time"] = ts
+            payload["tags"] = tags
+            self.client.publish(topic, json.dumps(payload), qos=self.qos, retain=self.retain)
+
+
+def make_sink(output_cfg: OutputConfig) -> WriteFunction:
+    """
+    Create the output described by the config, and return its write function
+    """
+    if output_cfg.kind == "stdout":
+        return StdoutSink().write
+    if output_cfg.kind == "sqlite":
+        return SQLiteSink(output_cfg.path).write
+    if output_cfg.kind == "mqtt":
+        if mqtt is None:
+            LOG.error("MQTT output requires the paho-mqtt package")
+            sys.exit(1)
+        return MQTTSink(
+            output_cfg.host,
+            port=output_cfg.port,
+            topic_prefix=output_cfg.topic_prefix,
+            username=output_cfg.username,
+            password=output_cfg.password,
+            qos=output_cfg.qos,
+            retain=output_cfg.retain,
+        ).write
+    raise ValueError(f"Unknown output: {output_cfg.kind}")
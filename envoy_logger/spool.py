@@ -0,0 +1,267 @@
+from typing import Callable, Dict, List, Any, Optional
+import os
+import threading
+import time
+import logging
+
+from .line_protocol import to_line_protocol
+
+LOG = logging.getLogger("spool")
+
+class Spool:
+    """
+    Append-only on-disk spool of line-protocol records.
+
+    Everything that is destined for InfluxDB is appended here first, so that
+    nothing is lost if the database is unreachable or the process restarts.
+    Records are stored one per line as: "<bucket>\\t<line protocol>"
+    Timestamps are in milliseconds.
+
+    Records are appended to an active segment file, which is rotated once it
+    grows past segment_size bytes. Writes are fsynced at most once every
+    fsync_interval seconds, and on rotation.
+    If the spool grows past max_size bytes, the oldest segments are discarded.
+    """
+    def __init__(
+        self,
+        path: str,
+        segment_size: int = 4 * 1024 * 1024,
+        max_size: int = 1024 * 1024 * 1024,
+        fsync_interval: float = 1.0,
+    ) -> None:
+        self.path = path
+        self.segment_size = segment_size
+        self.max_size = max_size
+        self.fsync_interval = fsync_interval
+
+        os.makedirs(self.path, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Set whenever records are appended
+        self.appended = threading.Event()
+        self._active = None
+        self._active_path = None # type: Optional[str]
+        self._active_size = 0
+        self._last_fsync = time.monotonic()
+
+        # Segments left over from a previous run still need to be replayed.
+        # Track their sizes to enforce max_size
+        self._segment_sizes = {} # type: Dict[str, int]
+        for name in os.listdir(self.path):
+            if name.endswith(".lp"):
+                seg_path = os.path.join(self.path, name)
+                self._segment_sizes[seg_path] = os.path.getsize(seg_path)
+        if self._segment_sizes:
+            LOG.info("Found %d unsent spool segments in: %s", len(self._segment_sizes), self.path)
+        self._next_seq = 0
+        for seg_path in self._segment_sizes:
+            seq = int(os.path.basename(seg_path)[:-3])
+            self._next_seq = max(self._next_seq, seq + 1)
+
+    @property
+    def size(self) -> int:
+        # Read from other threads (eg: metrics) while segments are added and removed
+        with self._lock:
+            return sum(self._segment_sizes.values())
+
+    def append(self, bucket: str, records: List[Any]) -> None:
+        """
+        Append records to the spool.
+        Records can either be line-protocol strings, or influxdb_client Points
+        """
+        lines = []
+        for record in records:
+            record = to_line_protocol(record)
+            if record:
+                lines.append(f"{bucket}\t{record}\n")
+        if not lines:
+            return
+        data = "".join(lines).encode("utf-8")
+
+        with self._lock:
+            if self._active is None:
+                self._open_segment()
+            self._active.write(data)
+            self._active_size += len(data)
+            self._segment_sizes[self._active_path] = self._active_size
+
+            if self._active_size >= self.segment_size:
+                self._rotate()
+            elif time.monotonic() - self._last_fsync >= self.fsync_interval:
+                self._fsync()
+
+            self._enforce_max_size()
+        self.appended.set()
+
+    def oldest_segment(self) -> Optional[str]:
+        """
+        Return the path of the oldest complete segment, or None if there is
+        nothing to replay.
+        If only the active segment has data, it is rotated so that it can be
+        replayed right away.
+        """
+        with self._lock:
+            closed = [p for p in self._segment_sizes if p != self._active_path]
+            if not closed and self._active_size:
+                self._rotate()
+                closed = [p for p in self._segment_sizes]
+            if not closed:
+                return None
+            return min(closed)
+
+    def reject(self, bucket: str, records: List[str]) -> None:
+        """
+        Set aside records that the database rejected, in the same format as
+        the spool, so they can be inspected and fixed up by hand.
+        """
+        path = os.path.join(self.path, "rejected")
+        LOG.warning("Moved %d rejected records to: %s", len(records), path)
+        with self._lock:
+            with open(path, "a", encoding="utf-8") as f:
+                f.writelines(f"{bucket}\t{record}\n" for record in records)
+
+    def remove_segment(self, path: str) -> None:
+        with self._lock:
+            self._segment_sizes.pop(path, None)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _open_segment(self) -> None:
+        self._active_path = os.path.join(self.path, f"{self._next_seq:012d}.lp")
+        self._next_seq += 1
+        self._active = open(self._active_path, "ab")
+        self._active_size = 0
+        self._segment_sizes[self._active_path] = 0
+
+    def _fsync(self) -> None:
+        self._active.flush()
+        os.fsync(self._active.fileno())
+        self._last_fsync = time.monotonic()
+
+    def _rotate(self) -> None:
+        self._fsync()
+        self._active.close()
+        self._active = None
+        self._active_path = None
+        self._active_size = 0
+
+    def _enforce_max_size(self) -> None:
+        total = sum(self._segment_sizes.values())
+        while total > self.max_size:
+            closed = [p for p in self._segment_sizes if p != self._active_path]
+            if not closed:
+                break
+            oldest = min(closed)
+            LOG.warning("Spool exceeded %d bytes. Discarding oldest segment: %s", self.max_size, oldest)
+            total -= self._segment_sizes.pop(oldest)
+            os.remove(oldest)
+
+
+def is_permanent_error(e: Exception) -> bool:
+    """
+    Whether the database rejected the write outright (4xx other than 429),
+    eg: missing bucket, field type conflict, malformed line.
+    Connection errors, 5xx and 429 are worth retrying.
+    """
+    status = getattr(e, "status", None)
+    return isinstance(status, int) and 400 <= status < 500 and status != 429
+
+
+class SpoolReplayer:
+    """
+    Background worker that drains the spool into the database.
+
+    Segments are replayed oldest-first, at most rate records per second, in
+    batches of batch_size. A segment is only deleted once all of its records
+    were written. If the process dies part way through, the segment is
+    replayed again from the start. This is harmless since InfluxDB overwrites
+    points that have the same series and timestamp.
+
+    Failed writes are retried, unless the database rejected them outright
+    (eg: missing bucket). Those batches are moved to the spool's "rejected"
+    file instead, so that they do not hold up everything behind them.
+    """
+    def __init__(
+        self,
+        spool: Spool,
+        write: Callable[[str, List[str]], None],
+        rate: float = 5000,
+        batch_size: int = 5000,
+        poll_interval: float = 1.0,
+        retry_delay: float = 10.0,
+    ) -> None:
+        self.spool = spool
+        self._write = write
+        self.rate = rate
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self._last_replay = None # type: Optional[float]
+
+        self._thread = threading.Thread(target=self._run, name="spool-replay", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            path = self.spool.oldest_segment()
+            if path is None:
+                self._wait()
+                continue
+            self._replay_segment(path)
+            self.spool.remove_segment(path)
+            self._last_replay = time.monotonic()
+
+    def _wait(self) -> None:
+        """
+        Wait for records to be appended. Replays at most every poll_interval,
+        so that records are not written one tiny segment at a time. The first
+        records are replayed right away.
+        """
+        if self._last_replay is not None:
+            delay = self._last_replay + self.poll_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+                return
+        self.spool.appended.wait(self.poll_interval)
+        self.spool.appended.clear()
+
+    def _replay_segment(self, path: str) -> None:
+        batches = [] # type: List[tuple]
+        by_bucket = {} # type: Dict[str, List[str]]
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        # Incomplete record from an interrupted write
+                        continue
+                    bucket, sep, record = line[:-1].partition("\t")
+                    if not sep or not record:
+                        continue
+                    records = by_bucket.setdefault(bucket, [])
+                    records.append(record)
+                    if len(records) >= self.batch_size:
+                        batches.append((bucket, records))
+                        by_bucket[bucket] = []
+        except FileNotFoundError:
+            # Was discarded to enforce the spool size limit
+            return
+        for bucket, records in by_bucket.items():
+            if records:
+                batches.append((bucket, records))
+
+        for bucket, records in batches:
+            while True:
+                try:
+                    self._write(bucket, records)
+                except Exception as e:
+                    if is_permanent_error(e):
+                        # Retrying won't help, and would hold up everything after it
+                        LOG.error("InfluxDB rejected %d records to %s: %s", len(records), bucket, e)
+                        self.spool.reject(bucket, records)
+                        break
+                    LOG.error("Failed to replay %d records to %s: %s", len(records), bucket, e)
+                    time.sleep(self.retry_delay)
+                else:
+                    break
+            # Limit the replay rate so a large backlog does not swamp the database
+            time.sleep(len(records) / self.rate)
@@ -0,0 +1,119 @@
+from collections import deque
+from typing import Callable, Deque, Dict, List, Tuple, Any
+import threading
+import time
+import logging
+
+LOG = logging.getLogger("writer")
+
+class BatchWriter:
+    """
+    Decouples the sampling loop from database latency.
+
+    Records are put on a bounded queue and written in batches from a
+    background thread. A batch is flushed once it reaches batch_size records,
+    or flush_interval seconds after the writer started waiting for it.
+
+    If the queue fills up (database is slow or unreachable), the overflow
+    policy decides what happens:
+        "drop-oldest": Discard the oldest queued records to make room
+        "block": Block the producer until there is room
+    """
+    def __init__(
+        self,
+        write: Callable[[str, List[Any]], None],
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        queue_size: int = 10000,
+        overflow: str = "drop-oldest",
+        retry_delay: float = 5.0,
+        name: str = "batch-writer",
+    ) -> None:
+        if overflow not in ("drop-oldest", "block"):
+            raise ValueError(f"Invalid overflow policy: {overflow}")
+
+        self._write = write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.retry_delay = retry_delay
+
+        self.dropped_count = 0
+
+        self._queue = deque() # type: Deque[Tuple[str, Any]]
+        self._cv = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def put(self, bucket: str, records: List[Any]) -> None:
+        """
+        Queue records to be written to the bucket
+        """
+        with self._cv:
+            for record in records:
+                if len(self._queue) >= self.queue_size:
+                    if self.overflow == "block":
+                        while len(self._queue) >= self.queue_size:
+                            self._cv.wait()
+                    else:
+                        self._queue.popleft()
+                        self.dropped_count += 1
+                        if self.dropped_count % 1000 == 1:
+                            LOG.warning("Write queue is full. Dropped %d records so far", self.dropped_count)
+                self._queue.append((bucket, record))
+            self._cv.notify_all()
+
+    def close(self, timeout: float = None) -> None:
+        """
+        Flush anything still queued and stop the background thread
+        """
+        with self._cv:
+            self._stopping = True
+            self._cv.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._cv:
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._queue) < self.batch_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cv.wait(remaining)
+
+                n = min(len(self._queue), self.batch_size)
+                batch = [self._queue.popleft() for _ in range(n)]
+                if not batch and self._stopping:
+                    return
+                # Wake up any blocked producers
+                self._cv.notify_all()
+
+            if batch:
+                self._flush(batch)
+
+    def _flush(self, batch: List[Tuple[str, Any]]) -> None:
+        # Group by bucket, preserving order
+        by_bucket = {} # type: Dict[str, List[Any]]
+        for bucket, record in batch:
+            by_bucket.setdefault(bucket, []).append(record)
+
+        for bucket, records in by_bucket.items():
+            while True:
+                try:
+                    self._write(bucket, records)
+                except Exception as e:
+                    # Hold onto this batch and keep retrying. Meanwhile the
+                    # queue absorbs new records, subject to the overflow policy
+                    LOG.error("Failed to write %d records to %s: %s", len(records), bucket, e)
+                    if self._stopping:
+                        return
+                    time.sleep(self.retry_delay)
+                else:
+                    break
@@ -12,4 +12,12 @@ setuptools.setup(
         "influxdb-client",
         "PyYAML",
     ],
+    extras_require={
+        # Faster parsing of Envoy responses
+        "fast": ["orjson"],
+        # Faster inverter filtering for installs with thousands of inverters
+        "large": ["numpy"],
+        # MQTT output
+        "mqtt": ["paho-mqtt"],
+    },
 )